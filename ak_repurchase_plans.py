@@ -10,18 +10,28 @@ ak_plans_min.py
 可选写入 SQLite：
   python ak_plans_min.py --outdir . --sqlite repurchase_plan.db
 """
-import json
-import os, re, argparse, hashlib, sqlite3
+import os, argparse, csv, hashlib, sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, date
 from typing import Optional
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
-import fetch_runner
-
 RESULT_DIR = Path(__file__).resolve().parent / "result"
 
-_PLACEHOLDER_LOWER = {
+PLAN_COLUMNS = [
+    "code", "sec_name", "plan_key", "version",
+    "announce_date", "start_date",
+    "price_lower", "price_upper", "amount_upper", "volume_upper",
+    "latest_price", "progress_text",
+]
+
+_NUMERIC_PLAN_COLUMNS = {
+    "version", "price_lower", "price_upper", "amount_upper", "volume_upper", "latest_price",
+}
+
+_PLACEHOLDER_LOWER = frozenset({
     "",
     "--",
     "—",
@@ -34,7 +44,7 @@ _PLACEHOLDER_LOWER = {
     "待披露",
     "不披露",
     "暂无数据",
-}
+})
 
 def normalize_code_str(value):
     """Force stock code to 6-digit string when possible; fallback to trimmed string."""
@@ -59,45 +69,90 @@ def normalize_code_str(value):
     return s
 
 
-def _strip_placeholder(value):
-    if not isinstance(value, str):
-        return value
-    stripped = value.strip()
-    if not stripped:
-        return None
-    lowered = stripped.lower()
-    if lowered in _PLACEHOLDER_LOWER:
-        return None
-    if stripped in {"—", "--", "暂无数据", "待定", "待披露", "不披露"}:
-        return None
-    return stripped
+def normalize_code_series(s: pd.Series) -> pd.Series:
+    """normalize_code_str 的整列版本：股票代码重复度很高，相同取值只规范化一次"""
+    codes, uniques = pd.factorize(s)
+    # 末尾追加 None，缺失值的编码 -1 正好取到它
+    mapped = np.array([normalize_code_str(v) for v in uniques] + [None], dtype=object)
+    return pd.Series(mapped[codes], index=s.index, dtype=object)
+
+
+def _strip_placeholder_series(s: pd.Series) -> pd.Series:
+    """整列去首尾空白，占位符（不区分大小写）/空串置为缺失"""
+    stripped = s.astype("string").str.strip()
+    return stripped.mask(stripped.str.lower().isin(_PLACEHOLDER_LOWER), pd.NA)
 
-def load_akshare_raw() -> pd.DataFrame:
+# 价格区间：第一个数字 + 可选的第二个数字（中间任意非数字分隔）
+_RANGE_PATTERN = r"([0-9]+(?:\.[0-9]+)?)(?:[^0-9]+([0-9]+(?:\.[0-9]+)?))?"
+
+def _raw_cache_path() -> Path:
+    """AkShare 原始表的当日缓存文件（按 UTC 日期区分）"""
+    return RESULT_DIR / f"ak_repurchase_raw_{pd.Timestamp.now(tz='UTC'):%Y%m%d}.parquet"
+
+def load_akshare_raw(refresh: bool = False) -> pd.DataFrame:
+    cache = _raw_cache_path()
+    if cache.exists() and not refresh:
+        try:
+            return pd.read_parquet(cache)
+        except Exception as exc:
+            print(f"[WARN] 读取 AkShare 缓存失败，重新拉取: {exc}")
     import akshare as ak
     # 东方财富-股票-回购-回购股份-回购进展（含计划区间&起始时间等），AkShare 会聚合全市场
     df = ak.stock_repurchase_em()
+    # 同一天内重复运行直接读本地 parquet；写缓存失败（如未安装 pyarrow）不影响主流程
+    try:
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        # 源表的 object 列常混有数字/字符串/None，parquet 无法直接落盘，统一存为可空 string
+        df.astype({c: "string" for c in df.columns if df[c].dtype == object}).to_parquet(cache, index=False)
+        for stale in cache.parent.glob("ak_repurchase_raw_*.parquet"):
+            if stale != cache:
+                stale.unlink()
+    except Exception as exc:
+        print(f"[WARN] 写入 AkShare 缓存失败: {exc}")
     # 典型列（以你日志为准）：
     # ['序号','股票代码','股票简称','最新价','计划回购价格区间','计划回购数量区间-下限','计划回购数量区间-上限',
     #  '占公告前一日总股本比例-下限','占公告前一日总股本比例-上限','计划回购金额区间-下限','计划回购金额区间-上限',
     #  '回购起始时间','实施进度','已回购股份价格区间-下限','已回购股份价格区间-上限','已回购股份数量','已回购金额','最新公告日期']
     return df
 
-def parse_range_to_lo_hi(s: str):
-    """把 '10.00-12.00元' / '—' 之类转成 (lo, hi) 浮点对；失败返回 (None, None)"""
-    if s is None or s == "" or str(s).strip("—- ").lower() in {"nan", "none"}:
-        return (None, None)
-    txt = str(s)
-    # 提取所有数字（含小数）
-    nums = re.findall(r"[0-9]+(?:\.[0-9]+)?", txt)
-    if not nums:
-        return (None, None)
-    if len(nums) == 1:
-        x = float(nums[0])
-        return (x, x)
-    lo, hi = float(nums[0]), float(nums[1])
-    if lo > hi:
-        lo, hi = hi, lo
-    return (lo, hi)
+def _parse_dates(s: pd.Series) -> pd.Series:
+    """pd.to_datetime(errors="coerce") 的去重版本：相同的日期取值只解析一次"""
+    codes, uniques = pd.factorize(s)
+    parsed = pd.to_datetime(pd.Series(uniques), errors="coerce")
+    return pd.Series(parsed.array.take(codes, allow_fill=True), index=s.index)
+
+def _hash_plan_keys(fingerprints):
+    """指纹 -> 16 位十六进制 plan_key。
+    plan_key 已写入 buyback/ak_plans 作为关联键，换用其它哈希会让历史记录与计划失配，因此保留 md5 截断格式。"""
+    md5 = hashlib.md5
+    return [md5(fp.encode(), usedforsecurity=False).hexdigest()[:16] for fp in fingerprints]
+
+def _plan_key_part(s: pd.Series) -> pd.Series:
+    """把一列转成 plan_key 指纹片段，沿用原先 `value or ''` 的写法：缺失/空串/0 记为空，float NaN 记为 'nan'"""
+    if pd.api.types.is_float_dtype(s):
+        arr = s.to_numpy(dtype="float64", na_value=np.nan)
+        part = np.where(arr == 0, "", arr.astype(str))
+        return pd.Series(part, index=s.index, dtype=object)
+    return s.astype("string").fillna("").astype(object)
+
+def parse_range_series(s: pd.Series):
+    """把 '10.00-12.00元' / '—' 之类整列转成 (lo, hi) 两列 float64：一次正则提取前两个数字，无数字为 NaN"""
+    ext = s.astype("string").str.extract(_RANGE_PATTERN)
+    lo = pd.to_numeric(ext[0], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    hi = pd.to_numeric(ext[1], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    # 只有一个数字时上下限相同
+    hi = np.where(np.isnan(hi), lo, hi)
+    swap = lo > hi
+    return (
+        pd.Series(np.where(swap, hi, lo), index=s.index, dtype="float64"),
+        pd.Series(np.where(swap, lo, hi), index=s.index, dtype="float64"),
+    )
+
+def _to_float_series(s: pd.Series) -> pd.Series:
+    """数量/金额列转 float64：去千分位逗号后整列 to_numeric，非法值为 NaN"""
+    if not pd.api.types.is_numeric_dtype(s):
+        s = s.astype("string").str.replace(",", "", regex=False)
+    return pd.to_numeric(s, errors="coerce").astype("float64")
 
 def normalize(df: pd.DataFrame) -> pd.DataFrame:
     # 只保留我们关心的列；不同版本可能列名有细微差异，这里尽量兜底
@@ -115,48 +170,54 @@ def normalize(df: pd.DataFrame) -> pd.DataFrame:
         "progress": "实施进度",
         "ann_date": "最新公告日期",
     }
-    out = pd.DataFrame()
-    for k, v in m.items():
-        out[k] = df.get(v)
-
-    out["code"] = out["code"].apply(normalize_code_str)
-
-    for col in ["name", "plan_price_range", "progress"]:
-        if col in out.columns:
-            out[col] = out[col].apply(_strip_placeholder)
-
-    out["latest_price"] = pd.to_numeric(out.get("latest_price"), errors="coerce")
+    has = set(col)
+    missing = pd.Series(pd.NA, index=df.index, dtype=object)
+    src = {k: df[v] if v in has else missing for k, v in m.items()}
+
+    # 各列先单独算好，最后一次性构造 DataFrame，避免逐列插入/覆盖带来的块合并与复制
+    cols = {
+        "code": normalize_code_series(src["code"]),
+        "name": _strip_placeholder_series(src["name"]),
+        "latest_price": pd.to_numeric(src["latest_price"], errors="coerce").astype("float64"),
+        "plan_price_range": _strip_placeholder_series(src["plan_price_range"]),
+        "progress": _strip_placeholder_series(src["progress"]),
+    }
 
     # 解析价格区间（一般单位：元/股）
-    pr_lo, pr_hi = [], []
-    for s in out["plan_price_range"]:
-        lo, hi = parse_range_to_lo_hi(s)
-        pr_lo.append(lo); pr_hi.append(hi)
-    out["price_upper"] = pd.Series(pr_hi, dtype="float64")  # 上限价
-    out["price_lower"] = pd.Series(pr_lo, dtype="float64")
+    cols["price_lower"], cols["price_upper"] = parse_range_series(cols["plan_price_range"])
 
     # 金额区间（一般单位：亿元；有的页面是“万元”，AkShare通常做过单位统一，这里不强转）
-    def to_float(x):
-        try:
-            return float(str(x).replace(",", ""))
-        except:
-            return None
     for c in ["plan_vol_lo", "plan_vol_hi", "plan_amt_lo", "plan_amt_hi"]:
-        out[c] = out[c].apply(to_float)
+        cols[c] = _to_float_series(src[c])
 
-    # 规范日期
-    out["start_date"] = pd.to_datetime(out["start_date"], errors="coerce").dt.date.astype("string")
-    out["ann_date"] = pd.to_datetime(out["ann_date"], errors="coerce").dt.date.astype("string")
+    # 规范日期：内部保留 datetime64 影子列，字符串仅用于指纹和输出
+    cols["_start_dt"] = _parse_dates(src["start_date"]).dt.normalize()
+    cols["_ann_dt"] = _parse_dates(src["ann_date"]).dt.normalize()
+    cols["start_date"] = cols["_start_dt"].dt.strftime("%Y-%m-%d").astype("string")
+    cols["ann_date"] = cols["_ann_dt"].dt.strftime("%Y-%m-%d").astype("string")
 
     # 生成 plan_key（同一公司可能存在并行计划：用公告日+价格上限+金额上限+数量上限+起始日构指纹）
-    def make_plan_key(row):
-        s = f"{row.get('code') or ''}|{row.get('ann_date') or ''}|{row.get('price_upper') or ''}|{row.get('plan_amt_hi') or ''}|{row.get('plan_vol_hi') or ''}|{row.get('start_date') or ''}"
-        return hashlib.md5(s.encode()).hexdigest()[:16]
-    out["plan_key"] = out.apply(make_plan_key, axis=1)
+    # 整列拼接指纹字符串，去重后只对不同的指纹取 md5，再按编码映射回各行（保持与历史 plan_key 一致）
+    key_cols = ["code", "ann_date", "price_upper", "plan_amt_hi", "plan_vol_hi", "start_date"]
+    parts = [_plan_key_part(cols[c]) for c in key_cols]
+    fingerprint = parts[0].str.cat(parts[1:], sep="|")
+    fp_codes, fp_uniques = pd.factorize(fingerprint)
+    cols["plan_key"] = pd.Series(
+        np.asarray(_hash_plan_keys(fp_uniques), dtype=object)[fp_codes], index=df.index
+    )
+    out = pd.DataFrame(cols, index=df.index)
 
     # 版本号（同一 plan_key 可能有多次“最新公告日期”变更，这里按 ann_date 排序给序号）
-    out = out.sort_values(["code", "plan_key", "ann_date"], kind="mergesort")
-    out["version"] = out.groupby(["code", "plan_key"]).cumcount() + 1
+    # 分组键转为 category，排序/分组走整数编码而不是逐个比较 Python 字符串
+    code_dtype, key_dtype = out["code"].dtype, out["plan_key"].dtype
+    out["code"] = out["code"].astype("category")
+    out["plan_key"] = out["plan_key"].astype("category")
+    # 从右到左依次做单键稳定排序，结果与多键排序一致
+    for key in ["_ann_dt", "plan_key", "code"]:
+        out = out.sort_values(key, kind="mergesort")
+    out["version"] = out.groupby(["code", "plan_key"], sort=False, observed=True).cumcount() + 1
+    out["code"] = out["code"].astype(code_dtype)
+    out["plan_key"] = out["plan_key"].astype(key_dtype)
 
     # 统一计划表字段
     res = out.rename(columns={
@@ -165,53 +226,139 @@ def normalize(df: pd.DataFrame) -> pd.DataFrame:
         "progress": "progress_text",
         "ann_date": "announce_date",
         "name": "sec_name",
-    })[
-        ["code","sec_name","plan_key","version",
-         "announce_date","start_date",
-         "price_lower","price_upper","amount_upper","volume_upper",
-         "latest_price","progress_text"]
-    ]
+    })[PLAN_COLUMNS + ["_ann_dt", "_start_dt"]]
     return res
 
+def _pair_indices(ends: np.ndarray):
+    """第 i 行与 (i, ends[i]) 区间内每一行配对，返回全部下标对 (left, right)，顺序同双重循环"""
+    pos = np.arange(len(ends))
+    counts = np.maximum(ends - pos - 1, 0)
+    left = np.repeat(pos, counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return left, left + 1 + offsets
+
 def detect_overlap(plans: pd.DataFrame) -> pd.DataFrame:
     """用 start_date + 缺失 end_date 的情况下，按同 code 的 plan_key 之间的“起始日接近”粗识别并行（Ak 这张表多数无 end_date，更多用于并行提示）"""
+    columns = ["code","plan_key_1","plan_key_2","start_1","start_2","announce_1","announce_2"]
     if plans.empty:
-        return pd.DataFrame(columns=["code","plan_key_1","plan_key_2","start_1","start_2","announce_1","announce_2"])
-    x = plans.copy()
-    x["sd"] = pd.to_datetime(x["start_date"], errors="coerce")
-    x["ad"] = pd.to_datetime(x["announce_date"], errors="coerce")
-    out = []
-    for code, g in x.groupby("code"):
-        g = g.sort_values(["sd","ad"])
-        arr = g.to_dict("records")
-        n = len(arr)
-        for i in range(n):
-            for j in range(i+1, n):
-                a, b = arr[i], arr[j]
-                # 起始日相差 <= 30 天，且公告日相隔 >= 1 天，认为可能是并行不同计划（经验规则，可按需调整）
-                try:
-                    d_sd = abs((a["sd"] - b["sd"]).days)
-                    d_ad = abs((a["ad"] - b["ad"]).days)
-                except Exception:
-                    continue
-                if pd.notna(a["sd"]) and pd.notna(b["sd"]) and d_sd <= 30 and d_ad >= 1:
-                    out.append({
-                        "code": code,
-                        "plan_key_1": a["plan_key"], "plan_key_2": b["plan_key"],
-                        "start_1": str(a["start_date"]), "start_2": str(b["start_date"]),
-                        "announce_1": str(a["announce_date"]), "announce_2": str(b["announce_date"]),
-                    })
-    return pd.DataFrame(out).drop_duplicates()
-
-def _coerce_db_value(value):
-    if value is None:
-        return None
-    if pd.isna(value):
-        return None
-    if isinstance(value, str):
-        stripped = _strip_placeholder(value)
-        return stripped
-    return value
+        return pd.DataFrame(columns=columns)
+    x = plans[["code", "plan_key", "start_date", "announce_date"]].copy()
+    # normalize 的结果自带解析好的日期影子列，直接复用；读自 CSV/SQLite 的计划才需要重新解析
+    x["sd"] = plans["_start_dt"] if "_start_dt" in plans.columns else _parse_dates(x["start_date"])
+    x["ad"] = plans["_ann_dt"] if "_ann_dt" in plans.columns else _parse_dates(x["announce_date"])
+    # 起始日/公告日缺失的记录不可能构成并行对，提前剔除
+    x = x.dropna(subset=["code", "sd", "ad"])
+    if len(x) < 2:
+        return pd.DataFrame(columns=columns)
+    x["code"] = x["code"].astype("category")
+    x = x.sort_values(["code", "sd", "ad"], kind="mergesort")
+    group = x["code"].cat.codes.to_numpy()
+    sd = x["sd"].to_numpy().astype("datetime64[D]").astype("int64")
+    ad = x["ad"].to_numpy().astype("datetime64[D]").astype("int64")
+
+    # 同 code 的行已按起始日连续排列：把 (code, 起始日) 压成单调整数键，每行的候选窗口止于组内
+    # 起始日超过 sd+30 的第一行（跨组时键差必然 > 30），只在窗口内生成下标对，避免组内全配对
+    sd_rel = sd - sd.min()
+    composite = group.astype("int64") * (int(sd_rel.max()) + 31) + sd_rel
+    left, right = _pair_indices(np.searchsorted(composite, composite + 30, side="right"))
+    # 起始日相差 <= 30 天（窗口已保证），且公告日相隔 >= 1 天，认为可能是并行不同计划（经验规则，可按需调整）
+    keep = np.abs(ad[left] - ad[right]) >= 1
+    left, right = left[keep], right[keep]
+
+    codes = x["code"].to_numpy()
+    keys = x["plan_key"].to_numpy()
+    starts = x["start_date"].astype(str).to_numpy()
+    announces = x["announce_date"].astype(str).to_numpy()
+    out = pd.DataFrame({
+        "code": codes[left],
+        "plan_key_1": keys[left],
+        "plan_key_2": keys[right],
+        "start_1": starts[left],
+        "start_2": starts[right],
+        "announce_1": announces[left],
+        "announce_2": announces[right],
+    }, columns=columns)
+    return out.drop_duplicates().reset_index(drop=True)
+
+def _db_column(s: pd.Series, numeric: bool) -> pd.Series:
+    """按列类型整列清洗成 sqlite3 可绑定的 Python 对象：数值列转数字，文本列去占位符，缺失统一为 None"""
+    s = pd.to_numeric(s, errors="coerce") if numeric else _strip_placeholder_series(s)
+    return s.astype(object).where(s.notna(), None)
+
+
+def _csv_float_text(s: pd.Series) -> np.ndarray:
+    """浮点列转成与 DataFrame.to_csv 相同的文本（Python repr，如 10.0、1e-05），缺失值为 None"""
+    arr = s.to_numpy(dtype="float64", na_value=np.nan)
+    text = arr.astype(str).astype(object)
+    text[np.isnan(arr)] = None
+    return text
+
+
+def write_csv(df: pd.DataFrame, path) -> None:
+    """写出带 BOM 的 UTF-8 CSV（兼容 Excel）；装了 pyarrow 时用其 C++ 写出器，否则退回 DataFrame.to_csv。
+    两条路径输出逐字节一致：浮点列预先格式化，表头用 csv 模块写；不带引号写出，
+    一旦有取值需要加引号（含逗号/引号/换行），或列类型不是文本/整数/浮点，就整体改用 to_csv。
+    单列表的空值行 to_csv 会写成 ""，同样直接走 to_csv"""
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+    except ImportError:
+        pa = None
+    if pa is None or len(df.columns) < 2:
+        df.to_csv(path, index=False, encoding="utf-8-sig")
+        return
+    columns = {}
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_float_dtype(s):
+            columns[col] = _csv_float_text(s)
+        elif pd.api.types.is_integer_dtype(s) or pd.api.types.is_string_dtype(s):
+            columns[col] = s
+        else:
+            df.to_csv(path, index=False, encoding="utf-8-sig")
+            return
+    try:
+        table = pa.Table.from_pandas(pd.DataFrame(columns, index=df.index), preserve_index=False)
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            csv.writer(f, lineterminator="\n").writerow(df.columns)
+        with open(path, "ab") as f:
+            pacsv.write_csv(table, f, write_options=pacsv.WriteOptions(include_header=False, quoting_style="none"))
+    except (pa.ArrowException, TypeError, ValueError):
+        df.to_csv(path, index=False, encoding="utf-8-sig")
+
+
+PLAN_UPSERT_SQL = """
+INSERT INTO ak_plans(
+    code, sec_name, plan_key, version,
+    announce_date, start_date,
+    price_lower, price_upper, amount_upper, volume_upper,
+    latest_price, progress_text
+)
+VALUES(?,?,?,?,?,?,?,?,?,?,?,?)
+ON CONFLICT(code, plan_key, version) DO UPDATE SET
+    sec_name=COALESCE(excluded.sec_name, ak_plans.sec_name),
+    announce_date=COALESCE(excluded.announce_date, ak_plans.announce_date),
+    start_date=COALESCE(excluded.start_date, ak_plans.start_date),
+    price_lower=COALESCE(excluded.price_lower, ak_plans.price_lower),
+    price_upper=COALESCE(excluded.price_upper, ak_plans.price_upper),
+    amount_upper=COALESCE(excluded.amount_upper, ak_plans.amount_upper),
+    volume_upper=COALESCE(excluded.volume_upper, ak_plans.volume_upper),
+    latest_price=COALESCE(excluded.latest_price, ak_plans.latest_price),
+    progress_text=COALESCE(excluded.progress_text, ak_plans.progress_text)
+"""
+
+
+def prepare_plan_rows(plans: pd.DataFrame) -> pd.DataFrame:
+    """按 PLAN_COLUMNS 生成可直接绑定到 PLAN_UPSERT_SQL 的行（code 规范化、占位符/缺失转 None）"""
+    # 只按 PLAN_COLUMNS 逐列生成待写入的列，不复制整张输入表（含影子列）
+    cols = {}
+    for col in PLAN_COLUMNS:
+        if col not in plans.columns:
+            cols[col] = pd.Series(None, index=plans.index, dtype=object)
+            continue
+        s = normalize_code_series(plans[col]) if col == "code" else plans[col]
+        cols[col] = _db_column(s, col in _NUMERIC_PLAN_COLUMNS)
+    return pd.DataFrame(cols, index=plans.index)
 
 
 def to_sqlite(db_path: str, plans: pd.DataFrame):
@@ -221,6 +368,9 @@ def to_sqlite(db_path: str, plans: pd.DataFrame):
         os.makedirs(directory, exist_ok=True)
     conn = sqlite3.connect(db_path)
     cur = conn.cursor()
+    # WAL 下整表重写不阻塞看板的读连接；synchronous=NORMAL 在 WAL 下仍保证崩溃后库文件一致
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
     cur.execute("""
     CREATE TABLE IF NOT EXISTS ak_plans(
       code TEXT, sec_name TEXT, plan_key TEXT, version INTEGER,
@@ -229,54 +379,14 @@ def to_sqlite(db_path: str, plans: pd.DataFrame):
       latest_price REAL, progress_text TEXT,
       PRIMARY KEY(code, plan_key, version)
     );""")
+    # detect_existing_plans_start 的 MIN(announce_date) 走索引，不必全表扫描
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ak_plans_ann ON ak_plans(announce_date)")
     conn.commit()
     if not plans.empty:
-        columns = [
-            "code",
-            "sec_name",
-            "plan_key",
-            "version",
-            "announce_date",
-            "start_date",
-            "price_lower",
-            "price_upper",
-            "amount_upper",
-            "volume_upper",
-            "latest_price",
-            "progress_text",
-        ]
-        sanitized = plans.copy()
-        sanitized["code"] = sanitized["code"].apply(normalize_code_str)
-        for col in columns:
-            if col not in sanitized.columns:
-                sanitized[col] = None
-        sanitized = sanitized[columns]
-        for col in sanitized.columns:
-            sanitized[col] = sanitized[col].map(_coerce_db_value)
+        sanitized = prepare_plan_rows(plans)
+        # 清表与写入放在同一个事务里：只提交一次，且中途失败不会留下空表
         cur.execute("DELETE FROM ak_plans")
-        conn.commit()
-        cur.executemany(
-            """
-            INSERT INTO ak_plans(
-                code, sec_name, plan_key, version,
-                announce_date, start_date,
-                price_lower, price_upper, amount_upper, volume_upper,
-                latest_price, progress_text
-            )
-            VALUES(?,?,?,?,?,?,?,?,?,?,?,?)
-            ON CONFLICT(code, plan_key, version) DO UPDATE SET
-                sec_name=COALESCE(excluded.sec_name, ak_plans.sec_name),
-                announce_date=COALESCE(excluded.announce_date, ak_plans.announce_date),
-                start_date=COALESCE(excluded.start_date, ak_plans.start_date),
-                price_lower=COALESCE(excluded.price_lower, ak_plans.price_lower),
-                price_upper=COALESCE(excluded.price_upper, ak_plans.price_upper),
-                amount_upper=COALESCE(excluded.amount_upper, ak_plans.amount_upper),
-                volume_upper=COALESCE(excluded.volume_upper, ak_plans.volume_upper),
-                latest_price=COALESCE(excluded.latest_price, ak_plans.latest_price),
-                progress_text=COALESCE(excluded.progress_text, ak_plans.progress_text)
-            """,
-            list(sanitized.itertuples(index=False, name=None)),
-        )
+        cur.executemany(PLAN_UPSERT_SQL, sanitized.itertuples(index=False, name=None))
         conn.commit()
     conn.close()
 
@@ -290,7 +400,7 @@ def filter_recent(df: pd.DataFrame, days: int, min_date: Optional[date] = None)
             break
     if not col:
         return df
-    dt = pd.to_datetime(df[col], errors="coerce")
+    dt = _parse_dates(df[col])
     if dt.isna().all():
         return df
     today = pd.Timestamp.utcnow().normalize().date()
@@ -298,7 +408,8 @@ def filter_recent(df: pd.DataFrame, days: int, min_date: Optional[date] = None)
         cutoff = min(min_date, today)
     else:
         cutoff = today - timedelta(days=days)
-    mask = dt.dt.date >= cutoff
+    # 直接与 datetime64 比较（NaT 恒为 False），不再逐行物化 Python date 对象
+    mask = dt >= pd.Timestamp(cutoff)
     return df.loc[mask]
 
 
@@ -318,12 +429,18 @@ def detect_existing_plans_start(outdir: str, sqlite_path: str = "") -> Optional[
         if not csv_path.exists():
             continue
         try:
-            df = pd.read_csv(csv_path, encoding="utf-8-sig")
+            # 只需要 announce_date 一列；缺该列时 usecols 会抛错，按不可用处理
+            df = pd.read_csv(
+                csv_path,
+                encoding="utf-8-sig",
+                usecols=["announce_date"],
+                dtype="string",
+                engine="c",
+            )
         except Exception:
             continue
-        if "announce_date" not in df.columns:
-            continue
-        dates = pd.to_datetime(df["announce_date"], errors="coerce").dropna()
+        # normalize 输出的是 ISO 日期，指定格式可跳过格式推断
+        dates = pd.to_datetime(df["announce_date"], errors="coerce", format="%Y-%m-%d").dropna()
         if dates.empty:
             continue
         cand = dates.min()
@@ -365,7 +482,44 @@ def detect_existing_plans_start(outdir: str, sqlite_path: str = "") -> Optional[
     return earliest.date() if earliest is not None else None
 
 
-def detect_fetch_runner_start() -> Optional[date]:
+def _fetch_runner_start_cache_path() -> Path:
+    """fetch_runner 最早公告日的缓存文件，内容按 UTC 日期校验"""
+    return RESULT_DIR / "fetch_runner_start.json"
+
+
+def detect_fetch_runner_start(refresh: bool = False) -> Optional[date]:
+    import json
+
+    # 同一天内已联网探测过就直接复用结果，省掉分页请求和限流等待
+    cache = _fetch_runner_start_cache_path()
+    today = pd.Timestamp.now(tz="UTC").strftime("%Y-%m-%d")
+    if cache.exists() and not refresh:
+        try:
+            with open(cache, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("day") == today:
+                return date.fromisoformat(cached["min_date"])
+        except Exception:
+            pass
+
+    min_date = _probe_fetch_runner_start()
+    if min_date is not None:
+        try:
+            cache.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"day": today, "min_date": min_date.isoformat()}, f)
+            os.replace(tmp, cache)
+        except Exception as exc:
+            print(f"[WARN] 写入 fetch_runner 起始日缓存失败: {exc}")
+    return min_date
+
+
+def _probe_fetch_runner_start() -> Optional[date]:
+    # fetch_runner 会连带导入 requests，只有真正需要联网兜底时才加载
+    import json
+    import fetch_runner
+
     cfg_path = getattr(fetch_runner, "PARAMS_PATH", Path(__file__).resolve().parent / "repurchase_params.json")
     try:
         with open(cfg_path, "r", encoding="utf-8") as f:
@@ -407,44 +561,44 @@ def main():
         default=0,
         help="仅保留最近 N 天内公告的计划；默认自动检测 plans_all.csv 的最早公告日期",
     )
+    ap.add_argument("--refresh", action="store_true", help="忽略当日缓存，重新拉取 AkShare 与 fetch_runner 数据")
     args = ap.parse_args()
 
-    raw = load_akshare_raw()
-    min_date = None
-    if args.days <= 0:
-        min_date = detect_existing_plans_start(args.outdir, args.sqlite)
-        if min_date:
-            today = pd.Timestamp.utcnow().normalize().date()
-            print(f"[INFO] 使用本地历史数据最早公告日 {min_date} 至 {today} 作为过滤范围")
-        else:
-            min_date = detect_fetch_runner_start()
+    # AkShare 全市场拉取与确定过滤起点（可能要走 fetch_runner 联网）互不依赖，后台线程并行拉取
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        raw_future = pool.submit(load_akshare_raw, args.refresh)
+        min_date = None
+        if args.days <= 0:
+            min_date = detect_existing_plans_start(args.outdir, args.sqlite)
             if min_date:
                 today = pd.Timestamp.utcnow().normalize().date()
-                print(f"[INFO] 使用 fetch_runner 最早可获取的公告日期 {min_date} 至 {today} 作为过滤范围")
+                print(f"[INFO] 使用本地历史数据最早公告日 {min_date} 至 {today} 作为过滤范围")
+            else:
+                min_date = detect_fetch_runner_start(args.refresh)
+                if min_date:
+                    today = pd.Timestamp.utcnow().normalize().date()
+                    print(f"[INFO] 使用 fetch_runner 最早可获取的公告日期 {min_date} 至 {today} 作为过滤范围")
+        raw = raw_future.result()
     raw = filter_recent(raw, args.days, min_date=min_date)
 
     if raw.empty:
         print("[INFO] 目标区间无回购相关记录（或源站限流）。已输出空表。")
         # 也导出一个空 CSV 供后续流程保持一致
-        empty = pd.DataFrame(columns=[
-            "code","sec_name","plan_key","version","announce_date","start_date",
-            "price_lower","price_upper","amount_upper","volume_upper",
-            "latest_price","progress_text"
-        ])
+        empty = pd.DataFrame(columns=PLAN_COLUMNS)
         os.makedirs(args.outdir, exist_ok=True)
-        empty.to_csv(os.path.join(args.outdir, "plans_all.csv"), index=False, encoding="utf-8-sig")
+        write_csv(empty, os.path.join(args.outdir, "plans_all.csv"))
         to_sqlite(args.sqlite, empty)
         return
 
     plans = normalize(raw)
     overlaps = detect_overlap(plans)
 
-    uniq_codes = sorted(set(plans["code"].dropna().astype(str)))
-    print(f"[INFO] 检测到 {len(uniq_codes)} 只股票的回购计划，输出目录: {os.path.abspath(args.outdir)}")
+    n_codes = plans["code"].dropna().nunique()
+    print(f"[INFO] 检测到 {n_codes} 只股票的回购计划，输出目录: {os.path.abspath(args.outdir)}")
 
     os.makedirs(args.outdir, exist_ok=True)
-    plans.to_csv(os.path.join(args.outdir, "plans_all.csv"), index=False, encoding="utf-8-sig")
-    overlaps.to_csv(os.path.join(args.outdir, "plans_overlap_hint.csv"), index=False, encoding="utf-8-sig")
+    write_csv(plans[PLAN_COLUMNS], os.path.join(args.outdir, "plans_all.csv"))
+    write_csv(overlaps, os.path.join(args.outdir, "plans_overlap_hint.csv"))
     to_sqlite(args.sqlite, plans)
     print(f"[OK] 导出: {os.path.join(args.outdir, 'plans_all.csv')}")
     print(f"[OK] 导出: {os.path.join(args.outdir, 'plans_overlap_hint.csv')}  (经验规则提示并行计划, 可人工复核)")
@@ -1,4 +1,5 @@
 # ak_repurchase_plans_incremental.py
+import argparse
 import importlib.util
 import sqlite3
 from pathlib import Path
@@ -31,6 +32,17 @@ PLAN_COLUMNS: List[str] = [
     "progress_text",
 ]
 
+# plans_all.csv 的文本列显式按字符串读取：跳过类型推断，也避免纯数字/形如 "12e45" 的 plan_key、
+# 带前导零的代码被解析成数字；数值列仍交给 pandas 推断，遇到脏值不至于整表读失败
+CSV_TEXT_DTYPES = {
+    "code": "string",
+    "sec_name": "string",
+    "plan_key": "string",
+    "announce_date": "string",
+    "start_date": "string",
+    "progress_text": "string",
+}
+
 
 def ensure_result_dir() -> None:
     RESULT_DIR.mkdir(parents=True, exist_ok=True)
@@ -49,17 +61,21 @@ def ensure_plan_table(conn: sqlite3.Connection) -> None:
         );
         """
     )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ak_plans_ann ON ak_plans(announce_date)")
     conn.commit()
 
 
 def align_columns(df: pd.DataFrame) -> pd.DataFrame:
-    work = pd.DataFrame(df)
-    for col in PLAN_COLUMNS:
-        if col not in work.columns:
-            work[col] = pd.NA
-    work = work[PLAN_COLUMNS]
-    work["plan_key"] = work["plan_key"].fillna("").astype(str)
-    work["code"] = work["code"].apply(ak_plans.normalize_code_str).fillna("").astype(str)
+    # 已对齐过的结果（及其切片、彼此拼接）带 _aligned 标记，直接返回，不再重复规范化
+    if df.attrs.get("_aligned") and list(df.columns) == PLAN_COLUMNS:
+        return df
+    # reindex 一步补齐/裁剪列，assign 一次生成结果，不再先整表复制再逐列覆盖
+    work = df.reindex(columns=PLAN_COLUMNS)
+    work = work.assign(
+        plan_key=work["plan_key"].fillna("").astype(str),
+        code=ak_plans.normalize_code_series(work["code"]).fillna("").astype(str),
+    )
+    work.attrs["_aligned"] = True
     return work
 
 
@@ -79,7 +95,7 @@ def load_existing() -> pd.DataFrame:
                 conn.close()
     if existing.empty and ALL_CSV.exists():
         try:
-            existing = pd.read_csv(ALL_CSV, encoding="utf-8-sig")
+            existing = pd.read_csv(ALL_CSV, encoding="utf-8-sig", dtype=CSV_TEXT_DTYPES)
         except Exception:
             existing = pd.DataFrame()
     return align_columns(existing)
@@ -94,31 +110,110 @@ def last_announce_date(existing: pd.DataFrame) -> str:
     return dt.max().strftime("%Y-%m-%d")
 
 
-def fetch_normalized() -> pd.DataFrame:
-    raw = ak_plans.load_akshare_raw()
+def existing_last_announce_date() -> str:
+    """只取历史最大公告日，不加载全量：SQLite 走 MAX(announce_date) 索引，无库/空库时只读 CSV 的 announce_date 列"""
+    ensure_result_dir()
+    if DB.exists():
+        conn: Optional[sqlite3.Connection] = None
+        row = None
+        try:
+            conn = sqlite3.connect(DB)
+            ensure_plan_table(conn)
+            row = conn.execute("SELECT MAX(announce_date), COUNT(*) FROM ak_plans").fetchone()
+        except Exception:
+            row = None
+        finally:
+            if conn is not None:
+                conn.close()
+        if row and row[1]:
+            return last_announce_date(pd.DataFrame({"announce_date": [row[0]]}))
+    if ALL_CSV.exists():
+        try:
+            dates = pd.read_csv(ALL_CSV, encoding="utf-8-sig", usecols=["announce_date"], dtype="string", engine="c")
+        except Exception:
+            dates = pd.DataFrame()
+        return last_announce_date(dates)
+    return last_announce_date(pd.DataFrame())
+
+
+def fetch_normalized(refresh: bool = False) -> pd.DataFrame:
+    # 默认复用全量脚本当天落盘的 AkShare parquet；refresh=True 时忽略缓存重新拉取（并覆盖当日缓存）
+    raw = ak_plans.load_akshare_raw(refresh)
     return ak_plans.normalize(raw)
 
 
-def filter_incremental(df: pd.DataFrame, since: str) -> pd.DataFrame:
-    if df.empty:
-        return df
+def since_cutoff(since: str) -> pd.Timestamp:
     cutoff = pd.to_datetime(since, errors="coerce")
     if pd.isna(cutoff):
         cutoff = pd.Timestamp("2000-01-01")
-    dt = pd.to_datetime(df["announce_date"], errors="coerce")
-    inc = df.loc[dt >= cutoff].copy()
+    return cutoff
+
+
+def filter_incremental(df: pd.DataFrame, since: str) -> pd.DataFrame:
+    if df.empty:
+        return df
+    # normalize 已带出解析好的 _ann_dt，直接复用
+    dt = df["_ann_dt"] if "_ann_dt" in df.columns else ak_plans._parse_dates(df["announce_date"])
+    inc = df.loc[dt >= since_cutoff(since)].copy()
     return align_columns(inc)
 
 
 def recompute_versions(df: pd.DataFrame) -> pd.DataFrame:
+    """重排版本号；结果保留 _ann_dt 影子列，供后续截取增量/识别并行时复用，落盘前按 PLAN_COLUMNS 取列"""
     work = align_columns(df)
+    work = work.assign(_ann_dt=ak_plans._parse_dates(work["announce_date"]))
     if work.empty:
         return work
-    work["announce_dt"] = pd.to_datetime(work["announce_date"], errors="coerce")
-    work = work.sort_values(["code", "plan_key", "announce_dt"], kind="mergesort")
+    work = work.sort_values(["code", "plan_key", "_ann_dt"], kind="mergesort")
     work = work.drop_duplicates(subset=["code", "plan_key", "announce_date"], keep="last")
-    work["version"] = work.groupby(["code", "plan_key"]).cumcount() + 1
-    return work.drop(columns=["announce_dt"])
+    work["version"] = work.groupby(["code", "plan_key"], sort=False).cumcount() + 1
+    return work
+
+
+def merge_increment(existing: pd.DataFrame, incremental: pd.DataFrame):
+    """只对增量涉及的 (code, plan_key) 组重排版本号，其余历史行原样保留。
+    返回 (combined 全量结果, updated 受影响组的新行, touched 受影响的键)"""
+    # 还没有版本号的历史行（如全量脚本输出里缺 code 的行）、以及 (code, plan_key, announce_date) 重复的历史组
+    # 也一并重排：整体重排会对所有行去重并重新编号，这些组不能原样保留
+    dup = existing.duplicated(subset=["code", "plan_key", "announce_date"], keep=False)
+    stale = existing.loc[existing["version"].isna() | dup, ["code", "plan_key"]]
+    touched = pd.concat([incremental[["code", "plan_key"]], stale], ignore_index=True).drop_duplicates()
+    hit = pd.MultiIndex.from_frame(existing[["code", "plan_key"]]).isin(pd.MultiIndex.from_frame(touched))
+    updated = recompute_versions(pd.concat([existing[hit], incremental], ignore_index=True))
+    kept = existing[~hit]
+    kept = kept.assign(
+        version=kept["version"].astype("int64"),
+        _ann_dt=ak_plans._parse_dates(kept["announce_date"]),
+    )
+    # 与整体重排时的输出顺序保持一致
+    combined = pd.concat([kept, updated], ignore_index=True)
+    combined = combined.sort_values(["code", "plan_key", "_ann_dt"], kind="mergesort")
+    return combined, updated, touched
+
+
+def write_plan_groups(combined: pd.DataFrame, updated: pd.DataFrame, touched: pd.DataFrame) -> None:
+    """ak_plans 里只替换受影响的计划组；表还是空的（历史来自 CSV 兜底）时整表写入"""
+    conn = sqlite3.connect(DB)
+    try:
+        ensure_plan_table(conn)
+        cur = conn.cursor()
+        full = cur.execute("SELECT COUNT(*) FROM ak_plans").fetchone()[0] == 0
+        if not full:
+            # 与写入时同样规范化键：空 code/plan_key 在库里是 NULL，用 IS 比较
+            keys = ak_plans.prepare_plan_rows(touched)[["code", "plan_key"]]
+            cur.executemany(
+                "DELETE FROM ak_plans WHERE code IS ? AND plan_key IS ?",
+                keys.itertuples(index=False, name=None),
+            )
+            cur.executemany(
+                ak_plans.PLAN_UPSERT_SQL,
+                ak_plans.prepare_plan_rows(updated).itertuples(index=False, name=None),
+            )
+            conn.commit()
+    finally:
+        conn.close()
+    if full:
+        ak_plans.to_sqlite(str(DB), combined)
 
 
 def run_loader() -> None:
@@ -138,29 +233,30 @@ def run_loader() -> None:
     print(f"load_to_db executed: {rows} rows merged (sources: {sources})")
 
 
-def main() -> None:
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--refresh", action="store_true", help="忽略当日 AkShare 缓存，重新拉取（同一天内再次运行以获取新公告时使用）")
+    args = ap.parse_args(argv)
     ensure_result_dir()
-    existing = load_existing()
-    since = last_announce_date(existing)
+    since = existing_last_announce_date()
     print("last announce_date:", since)
 
-    normalized = fetch_normalized()
+    normalized = fetch_normalized(args.refresh)
     incremental = filter_incremental(normalized, since)
     if incremental.empty:
         print("no new plan rows")
         return
 
-    combined = recompute_versions(pd.concat([existing, incremental], ignore_index=True))
-    ak_plans.to_sqlite(str(DB), combined)
+    # 有新增时才加载历史：plans_all.csv 仍输出全量，SQLite 只改写受影响的计划组
+    existing = load_existing()
+    combined, updated, touched = merge_increment(existing, incremental)
+    write_plan_groups(combined, updated, touched)
 
-    cutoff = pd.to_datetime(since, errors="coerce")
-    if pd.isna(cutoff):
-        cutoff = pd.Timestamp("2000-01-01")
-    incremental_out = combined.loc[pd.to_datetime(combined["announce_date"], errors="coerce") >= cutoff].copy()
+    incremental_out = combined.loc[combined["_ann_dt"] >= since_cutoff(since), PLAN_COLUMNS]
 
-    incremental_out.to_csv(INCREMENT_CSV, index=False, encoding="utf-8-sig")
-    combined.to_csv(ALL_CSV, index=False, encoding="utf-8-sig")
-    ak_plans.detect_overlap(combined).to_csv(OVERLAP_CSV, index=False, encoding="utf-8-sig")
+    ak_plans.write_csv(incremental_out, INCREMENT_CSV)
+    ak_plans.write_csv(combined[PLAN_COLUMNS], ALL_CSV)
+    ak_plans.write_csv(ak_plans.detect_overlap(combined), OVERLAP_CSV)
 
     print(f"increment saved: {len(incremental_out)} rows -> {INCREMENT_CSV}")
     print(f"plans_all updated: {len(combined)} rows -> {ALL_CSV}")
@@ -1,14 +1,20 @@
 # -*- coding: utf-8 -*-
 import sqlite3
+import threading
+from contextlib import asynccontextmanager
 from pathlib import Path
 from functools import lru_cache
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Tuple, Union
 
 import pandas as pd
 from fastapi import FastAPI, HTTPException, Query, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 BASE_DIR = Path(__file__).resolve().parent
 RESULT_DIR = BASE_DIR / "result"
@@ -23,7 +29,39 @@ LEGACY_PLAN_PREFIX = "__DEFAULT__:"
 if not DB_PATH.exists():
     raise SystemExit(f"数据库不存在：{DEFAULT_DB_PATH}，请先运行抓取与入库脚本。")
 
-app = FastAPI(title="A股上市公司回购")
+# 每个工作线程复用一条只读连接：保留 SQLite 页缓存，不必每个请求重新打开库文件
+_thread_local = threading.local()
+_connections: List[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+
+
+def get_connection() -> sqlite3.Connection:
+    conn = getattr(_thread_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(f"{DB_PATH.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only=ON")
+        conn.execute("PRAGMA cache_size=-65536")
+        conn.execute("PRAGMA mmap_size=268435456")
+        _thread_local.conn = conn
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+
+def close_connections() -> None:
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    yield
+    close_connections()
+
+
+app = FastAPI(title="A股上市公司回购", lifespan=lifespan)
 
 # 静态/模板
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
@@ -41,11 +79,7 @@ def asset_version(name: str) -> str:
 
 
 def read_sql(query: str, params: Optional[tuple] = None) -> pd.DataFrame:
-    conn = sqlite3.connect(DB_PATH)
-    try:
-        return pd.read_sql_query(query, conn, params=params)
-    finally:
-        conn.close()
+    return pd.read_sql_query(query, get_connection(), params=params)
 
 
 def format_code(value: Union[str, int, float, None]) -> str:
@@ -60,38 +94,46 @@ def format_code(value: Union[str, int, float, None]) -> str:
     return code_str.upper()
 
 
-def _normalize_label_piece(value: Optional[Any]) -> str:
-    """Convert any label component to a clean string."""
-    if value is None:
-        return ""
-    if isinstance(value, str):
-        return value.strip()
+def format_code_series(values: pd.Series) -> pd.Series:
+    """format_code 的列向量版本，供 DataFrame 使用"""
+    text = values.astype("string").str.strip().fillna("")
+    formatted = text.str.zfill(6).where(text.str.isdigit(), text.str.upper())
+    return formatted.astype(object)
+
+
+def build_plan_label_series(
+    plan_key: pd.Series,
+    plan_progress: pd.Series,
+    plan_announce: pd.Series
+) -> pd.Series:
+    """计划标签：公告日 · 进度，均缺失时用 plan_key；旧版默认计划统一显示“默认计划”"""
+    # 两列整体转成 string 再 strip，缺失值（None/NaN/NA）一律视为空串
+    announce = plan_announce.astype("string").str.strip().fillna("")
+    progress = plan_progress.astype("string").str.strip().fillna("")
+    both = (announce != "") & (progress != "")
+    label = (announce + " · " + progress).where(both, announce + progress)
+    label = label.where(label != "", plan_key.str.upper())
+    label = label.mask(plan_key.str.startswith(LEGACY_PLAN_PREFIX), "默认计划")
+    label = label.mask(plan_key == "", "")
+    return label.astype(object)
+
+
+def db_file_version() -> Tuple[int, int]:
+    """库文件及其 WAL 的修改时间；入库写入任一文件后取值变化"""
+    wal_path = DB_PATH.with_name(DB_PATH.name + "-wal")
     try:
-        if pd.isna(value):  # type: ignore[arg-type]
-            return ""
-    except TypeError:
-        pass
-    return str(value).strip()
+        wal_mtime = wal_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        wal_mtime = 0
+    return DB_PATH.stat().st_mtime_ns, wal_mtime
 
 
-def build_plan_label(plan_key: str, plan_progress: Optional[Any] = None, plan_announce: Optional[Any] = None) -> str:
-    if not plan_key:
-        return ""
-    if plan_key.startswith(LEGACY_PLAN_PREFIX):
-        return "默认计划"
-    pieces = []
-    plan_announce_norm = _normalize_label_piece(plan_announce)
-    if plan_announce_norm:
-        pieces.append(plan_announce_norm)
-    plan_progress_norm = _normalize_label_piece(plan_progress)
-    if plan_progress_norm:
-        pieces.append(plan_progress_norm)
-    label = " · ".join([p for p in pieces if p])
-    return label if label else plan_key.upper()
+def load_plan_reference() -> pd.DataFrame:
+    return _load_plan_reference_cached(db_file_version())
 
 
 @lru_cache(maxsize=1)
-def load_plan_reference() -> pd.DataFrame:
+def _load_plan_reference_cached(file_version: Tuple[int, int]) -> pd.DataFrame:
     try:
         plans = read_sql(
             """
@@ -116,7 +158,7 @@ def load_plan_reference() -> pd.DataFrame:
     if plans.empty:
         return plans
 
-    plans["code"] = plans["code"].apply(format_code)
+    plans["code"] = format_code_series(plans["code"])
     plans["plan_key"] = plans["plan_key"].fillna("").astype(str).str.strip()
     plans = plans[plans["plan_key"] != ""]
     if plans.empty:
@@ -139,40 +181,178 @@ def load_plan_reference() -> pd.DataFrame:
     return plans
 
 
-def load_buyback(
+def load_plan_meta() -> pd.DataFrame:
+    """按 (code, plan_key) 建好索引的计划字段，随库文件版本缓存，供 load_buyback 直接 join"""
+    return _load_plan_meta_cached(db_file_version())
+
+
+@lru_cache(maxsize=1)
+def _load_plan_meta_cached(file_version: Tuple[int, int]) -> pd.DataFrame:
+    plan_ref = _load_plan_reference_cached(file_version)
+    if plan_ref.empty:
+        return plan_ref
+    plan_meta = plan_ref.rename(columns={
+        "announce_date": "plan_announce_dt",
+        "start_date": "plan_start_dt",
+        "price_lower": "plan_price_lower",
+        "price_upper": "plan_price_upper",
+        "amount_upper": "plan_amount_upper",
+        "volume_upper": "plan_volume_upper",
+        "latest_price": "plan_latest_price",
+        "progress_text": "plan_progress_text",
+    })
+    plan_meta["plan_announce_date"] = plan_meta["plan_announce_dt"].dt.strftime("%Y-%m-%d")
+    plan_meta["plan_start_date"] = plan_meta["plan_start_dt"].dt.strftime("%Y-%m-%d")
+    plan_meta = plan_meta[[
+        "code",
+        "plan_key",
+        "plan_announce_dt",
+        "plan_start_dt",
+        "plan_announce_date",
+        "plan_start_date",
+        "plan_price_lower",
+        "plan_price_upper",
+        "plan_amount_upper",
+        "plan_volume_upper",
+        "plan_latest_price",
+        "plan_progress_text",
+    ]]
+    return plan_meta.set_index(["code", "plan_key"]).sort_index()
+
+
+def _buyback_filter(
     date_from: str,
     date_to: Optional[str],
     code: str
-) -> pd.DataFrame:
-    query = """
-    SELECT code,plan_key,name,date,amount,volume,avg_price,progress,start_date,end_date
-    FROM buyback
-    WHERE date >= ?
-    """
+) -> Tuple[str, List[Any]]:
+    """生成 buyback 查询共用的 WHERE 条件与参数"""
+    clauses = ["date >= ?"]
     params: List[Any] = [date_from]
     if date_to:
-        query += " AND date <= ?"
+        clauses.append("date <= ?")
         params.append(date_to)
     code_filter = code.strip()
-    if code_filter:
+    if len(code_filter) == 6 and code_filter.isdigit():
+        # 完整代码：库内代码已补齐 6 位，精确匹配可走 (code, date) 索引
+        clauses.append("code = ?")
+        params.append(code_filter)
+    elif code_filter:
         trimmed = code_filter.lstrip("0")
         like_exact = f"%{code_filter}%"
         like_trimmed = f"%{trimmed}%" if trimmed and trimmed != code_filter else None
         if like_trimmed:
-            query += " AND (code LIKE ? OR code LIKE ?)"
+            clauses.append("(code LIKE ? OR code LIKE ?)")
             params.extend([like_exact, like_trimmed])
         else:
-            query += " AND code LIKE ?"
+            clauses.append("code LIKE ?")
             params.append(like_exact)
+    return " AND ".join(clauses), params
+
+
+# 汇总/分组前先在 SQL 里完成与 format_code 一致的清洗：代码去空白、纯数字补齐 6 位、其余转大写，
+# 空代码行剔除；plan_key 为 NULL/空白时统一归入 __DEFAULT__:<代码> 旧版默认计划
+BUYBACK_CLEAN_SQL = f"""
+SELECT code, COALESCE(NULLIF(TRIM(plan_key), ''), '{LEGACY_PLAN_PREFIX}' || code) AS plan_key,
+       name, date, amount, volume, avg_price, progress, start_date, end_date
+FROM (
+    SELECT CASE WHEN raw_code GLOB '*[^0-9]*' THEN UPPER(raw_code)
+                WHEN LENGTH(raw_code) < 6 THEN SUBSTR('000000' || raw_code, -6)
+                ELSE raw_code END AS code,
+           plan_key, name, date, amount, volume, avg_price, progress, start_date, end_date
+    FROM (
+        SELECT TRIM(code) AS raw_code, plan_key, name, date, amount, volume, avg_price, progress, start_date, end_date
+        FROM buyback
+        WHERE {{where}}
+    )
+    WHERE raw_code <> ''
+)
+"""
+
+
+def _fetch_summary(where: str, params: List[Any]) -> Dict[str, Any]:
+    source = BUYBACK_CLEAN_SQL.format(where=where)
+    row = get_connection().execute(
+        f"""
+        SELECT COUNT(*), TOTAL(amount), TOTAL(volume),
+               COUNT(DISTINCT code), COUNT(DISTINCT date), MAX(date)
+        FROM ({source})
+        """,
+        params,
+    ).fetchone()
+    plans = get_connection().execute(
+        f"SELECT COUNT(*) FROM (SELECT DISTINCT code, plan_key FROM ({source}))",
+        params,
+    ).fetchone()
+    return {
+        "rows": int(row[0]),
+        "total_amount": float(row[1]),
+        "total_volume": float(row[2]),
+        "unique_codes": int(row[3]),
+        "unique_plans": int(plans[0]),
+        "distinct_dates": int(row[4]),
+        "latest_date": row[5],
+    }
+
+
+def _fetch_trend(where: str, params: List[Any]) -> pd.DataFrame:
+    return read_sql(
+        f"""
+        SELECT date AS date_str, TOTAL(amount) AS amount
+        FROM ({BUYBACK_CLEAN_SQL.format(where=where)})
+        GROUP BY date
+        ORDER BY date
+        """,
+        tuple(params),
+    )
+
+
+def _fetch_top(where: str, params: List[Any], date: str, n: int = 20) -> pd.DataFrame:
+    # 先剔除空代码再 LIMIT，保证返回满 n 个代码
+    return read_sql(
+        f"""
+        SELECT code, TOTAL(amount) AS amount
+        FROM ({BUYBACK_CLEAN_SQL.format(where=where + " AND date = ?")})
+        GROUP BY code
+        ORDER BY amount DESC, code
+        LIMIT ?
+        """,
+        tuple(params) + (date, n),
+    )
+
+
+# 按计划累计金额/数量由 SQLite 窗口函数计算，limit 行之外的明细不再进入 pandas；
+# 分区与 LIMIT 都作用在清洗后的 code/plan_key 上
+BUYBACK_ROWS_SQL = """
+SELECT *, MAX(cumulative_amount) OVER (PARTITION BY code, plan_key) AS plan_total
+FROM (
+    SELECT code, plan_key, name, date, amount, volume, avg_price, progress, start_date, end_date,
+           SUM(COALESCE(amount, 0)) OVER w AS cumulative_amount,
+           SUM(COALESCE(volume, 0)) OVER w AS cumulative_volume
+    FROM ({source})
+    WINDOW w AS (PARTITION BY code, plan_key ORDER BY date ROWS UNBOUNDED PRECEDING)
+)
+ORDER BY date DESC, code, plan_key, amount DESC
+"""
+
+
+def load_buyback(
+    date_from: str,
+    date_to: Optional[str],
+    code: str,
+    limit: Optional[int] = None
+) -> pd.DataFrame:
+    where, params = _buyback_filter(date_from, date_to, code)
+    query = BUYBACK_ROWS_SQL.format(source=BUYBACK_CLEAN_SQL.format(where=where))
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
 
     df = read_sql(query, tuple(params))
     if df.empty:
         return df
 
-    # 基础类型清洗
+    # 基础类型清洗（code/plan_key 已由 BUYBACK_CLEAN_SQL 规范化）
     df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    df["code"] = df["code"].apply(format_code)
-    df["plan_key"] = df["plan_key"].fillna("").astype(str).str.strip()
     df["name"] = df["name"].fillna("").astype(str)
     df["amount"] = pd.to_numeric(df["amount"], errors="coerce").fillna(0.0)
     df["volume"] = pd.to_numeric(df["volume"], errors="coerce").fillna(0.0)
@@ -181,44 +361,10 @@ def load_buyback(
     df["start_date"] = pd.to_datetime(df["start_date"], errors="coerce")
     df["end_date"] = pd.to_datetime(df["end_date"], errors="coerce")
 
-    df = df.dropna(subset=["code", "date"])
-    df = df[df["code"] != ""]
-    mask = df["plan_key"] == ""
-    if mask.any():
-        df.loc[mask, "plan_key"] = (
-            LEGACY_PLAN_PREFIX + df.loc[mask, "code"].fillna("UNKNOWN")
-        )
-    plan_ref = load_plan_reference()
-    plan_meta = pd.DataFrame()
-    if not plan_ref.empty:
-        plan_meta = plan_ref.rename(columns={
-            "plan_key": "plan_key",
-            "announce_date": "plan_announce_dt",
-            "start_date": "plan_start_dt",
-            "price_lower": "plan_price_lower",
-            "price_upper": "plan_price_upper",
-            "amount_upper": "plan_amount_upper",
-            "volume_upper": "plan_volume_upper",
-            "latest_price": "plan_latest_price",
-            "progress_text": "plan_progress_text",
-        })
-        plan_meta["plan_announce_date"] = plan_meta["plan_announce_dt"].dt.strftime("%Y-%m-%d")
-        plan_meta["plan_start_date"] = plan_meta["plan_start_dt"].dt.strftime("%Y-%m-%d")
-        plan_meta = plan_meta[[
-            "code",
-            "plan_key",
-            "plan_announce_dt",
-            "plan_start_dt",
-            "plan_announce_date",
-            "plan_start_date",
-            "plan_price_lower",
-            "plan_price_upper",
-            "plan_amount_upper",
-            "plan_volume_upper",
-            "plan_latest_price",
-            "plan_progress_text",
-        ]]
-        df = df.merge(plan_meta, on=["code", "plan_key"], how="left")
+    df = df.dropna(subset=["date"])
+    plan_meta = load_plan_meta()
+    if not plan_meta.empty:
+        df = df.join(plan_meta, on=["code", "plan_key"], how="left")
     else:
         df["plan_announce_date"] = None
         df["plan_start_date"] = None
@@ -229,36 +375,70 @@ def load_buyback(
         df["plan_latest_price"] = pd.NA
         df["plan_progress_text"] = None
 
-    df["plan_label"] = df.apply(
-        lambda row: build_plan_label(
-            row.get("plan_key", ""),
-            row.get("plan_progress_text"),
-            row.get("plan_announce_date")
-        ),
-        axis=1
+    df["plan_label"] = build_plan_label_series(
+        df["plan_key"],
+        df["plan_progress_text"],
+        df["plan_announce_date"]
     )
 
-    # 分组累计（按计划维度）
-    df = df.sort_values(["code", "plan_key", "date"])
-    df["cumulative_amount"] = df.groupby(["code", "plan_key"])["amount"].cumsum()
-    df["cumulative_volume"] = df.groupby(["code", "plan_key"])["volume"].cumsum()
-
     # 计算进度百分比（针对单一计划）
-    total_per_plan = df.groupby(["code", "plan_key"])["cumulative_amount"].transform("max").replace(0, pd.NA)
+    df["cumulative_amount"] = pd.to_numeric(df["cumulative_amount"], errors="coerce").fillna(0.0)
+    df["cumulative_volume"] = pd.to_numeric(df["cumulative_volume"], errors="coerce").fillna(0.0)
+    total_per_plan = pd.to_numeric(df.pop("plan_total"), errors="coerce")
+    total_per_plan = total_per_plan.where(total_per_plan != 0)
     df["progress_pct"] = ((df["cumulative_amount"] / total_per_plan) * 100).round(2)
     df["progress_pct"] = df["progress_pct"].fillna(0.0)
 
     return df
 
 
+def _nullable(values: pd.Series) -> pd.Series:
+    """缺失值统一转为 None，序列化为 JSON null"""
+    return values.astype(object).where(values.notna(), None)
+
+
+def _date_text(values: pd.Series) -> pd.Series:
+    return _nullable(values.dt.strftime("%Y-%m-%d"))
+
+
+def build_table_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """整列完成类型转换后一次性 to_dict，替代逐行拼装"""
+    table = pd.DataFrame({
+        "code": df["code"],
+        "name": df["name"],
+        "plan_key": df["plan_key"],
+        "plan_label": df["plan_label"],
+        "date": df["date"].dt.strftime("%Y-%m-%d"),
+        "amount": df["amount"].astype("float64"),
+        "cumulative_amount": df["cumulative_amount"].astype("float64"),
+        "volume": df["volume"].astype("float64"),
+        "cumulative_volume": df["cumulative_volume"].astype("float64"),
+        "avg_price": _nullable(df["avg_price"]),
+        "progress_text": df["progress"],
+        "plan_progress_text": _nullable(df["plan_progress_text"]),
+        "plan_amount_upper": _nullable(df["plan_amount_upper"]),
+        "plan_volume_upper": _nullable(df["plan_volume_upper"]),
+        "plan_price_lower": _nullable(df["plan_price_lower"]),
+        "plan_price_upper": _nullable(df["plan_price_upper"]),
+        "plan_latest_price": _nullable(df["plan_latest_price"]),
+        "plan_announce_date": _nullable(df["plan_announce_date"]),
+        "plan_start_date": _nullable(df["plan_start_date"]),
+        "progress_pct": df["progress_pct"].astype("float64"),
+        "start_date": _date_text(df["start_date"]),
+        "end_date": _date_text(df["end_date"]),
+    })
+    return table.to_dict(orient="records")
+
+
 def build_dashboard_payload(
     date_from: str,
     date_to: Optional[str],
     code: str,
     limit: int
 ) -> Dict[str, Any]:
-    df = load_buyback(date_from, date_to, code)
-    if df.empty:
+    where, params = _buyback_filter(date_from, date_to, code)
+    summary = _fetch_summary(where, params)
+    if summary["rows"] == 0:
         return {
             "summary": {
                 "date_from": date_from,
@@ -276,78 +456,36 @@ def build_dashboard_payload(
             }
         }
 
-    df = df.reset_index(drop=True)
-    df["date_str"] = df["date"].dt.strftime("%Y-%m-%d")
-
     # 汇总
-    total_amount = float(df["amount"].sum())
-    total_volume = float(df["volume"].sum())
-    unique_codes = int(df["code"].nunique())
-    unique_plans = int(df[["code", "plan_key"]].drop_duplicates().shape[0])
-    distinct_dates = df["date_str"].nunique()
+    total_amount = summary["total_amount"]
+    total_volume = summary["total_volume"]
+    unique_codes = summary["unique_codes"]
+    unique_plans = summary["unique_plans"]
+    distinct_dates = summary["distinct_dates"]
     avg_daily_amount = float(total_amount / distinct_dates) if distinct_dates else 0.0
-    latest_date = df["date"].max()
-    latest_str = latest_date.strftime("%Y-%m-%d") if pd.notna(latest_date) else None
+    latest_str = summary["latest_date"]
 
     # 趋势图
-    trend_df = (
-        df.groupby("date_str", as_index=False)["amount"]
-        .sum()
-        .sort_values("date_str")
-    )
+    trend_df = _fetch_trend(where, params)
     trend_payload = {
         "dates": trend_df["date_str"].tolist(),
-        "amounts": [float(x) for x in trend_df["amount"].tolist()]
+        "amounts": trend_df["amount"].tolist()
     }
 
     # TopN 图
     top_payload = {"date": latest_str, "labels": [], "values": []}
     if latest_str:
-        latest_df = df[df["date_str"] == latest_str]
-        if not latest_df.empty:
-            top_df = (
-                latest_df.groupby("code", as_index=False)["amount"]
-                .sum()
-                .sort_values("amount", ascending=False)
-                .head(20)
-            )
+        top_df = _fetch_top(where, params, latest_str)
+        if not top_df.empty:
             top_payload = {
                 "date": latest_str,
                 "labels": top_df["code"].tolist(),
-                "values": [float(x) for x in top_df["amount"].tolist()]
+                "values": top_df["amount"].tolist()
             }
 
-    # 表格数据（按日期/金额排序）
-    table_df = df.sort_values(
-        ["date", "code", "plan_key", "amount"],
-        ascending=[False, True, True, False]
-    ).head(limit)
-    table_records: List[Dict[str, Any]] = []
-    for row in table_df.itertuples(index=False):
-        table_records.append({
-            "code": row.code,
-            "name": row.name,
-            "plan_key": row.plan_key,
-            "plan_label": row.plan_label,
-            "date": row.date.strftime("%Y-%m-%d"),
-            "amount": float(row.amount),
-            "cumulative_amount": float(row.cumulative_amount),
-            "volume": float(row.volume),
-            "cumulative_volume": float(row.cumulative_volume),
-            "avg_price": float(row.avg_price) if pd.notna(row.avg_price) else None,
-            "progress_text": row.progress,
-            "plan_progress_text": row.plan_progress_text if isinstance(row.plan_progress_text, str) else None,
-            "plan_amount_upper": float(row.plan_amount_upper) if pd.notna(row.plan_amount_upper) else None,
-            "plan_volume_upper": float(row.plan_volume_upper) if pd.notna(row.plan_volume_upper) else None,
-            "plan_price_lower": float(row.plan_price_lower) if pd.notna(row.plan_price_lower) else None,
-            "plan_price_upper": float(row.plan_price_upper) if pd.notna(row.plan_price_upper) else None,
-            "plan_latest_price": float(row.plan_latest_price) if pd.notna(row.plan_latest_price) else None,
-            "plan_announce_date": row.plan_announce_date if isinstance(row.plan_announce_date, str) else None,
-            "plan_start_date": row.plan_start_date if isinstance(row.plan_start_date, str) else None,
-            "progress_pct": float(row.progress_pct),
-            "start_date": row.start_date.strftime("%Y-%m-%d") if pd.notna(row.start_date) else None,
-            "end_date": row.end_date.strftime("%Y-%m-%d") if pd.notna(row.end_date) else None
-        })
+    # 表格数据（按日期/金额排序，SQL 已排好序并截取 limit 行）
+    table_df = load_buyback(date_from, date_to, code, limit)
+    table_records = build_table_records(table_df) if not table_df.empty else []
 
     return {
         "summary": {
@@ -367,6 +505,45 @@ def build_dashboard_payload(
         }
     }
 
+def render_json(payload: Dict[str, Any]) -> bytes:
+    """序列化接口数据；装了 orjson 时用其 C 实现，否则退回 JSONResponse 的标准库编码"""
+    if orjson is None:
+        return JSONResponse(payload).body
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+# 每条缓存是整份已渲染的响应（limit=5000 时可达数 MB），只保留少量条目
+@lru_cache(maxsize=32)
+def _build_payload_cached(
+    date_from: str,
+    date_to: Optional[str],
+    code: str,
+    limit: int,
+    db_version: Tuple[int, int]
+) -> bytes:
+    # 缓存序列化后的字节，命中时无需重复计算与编码
+    payload = build_dashboard_payload(date_from=date_from, date_to=date_to, code=code, limit=limit)
+    return render_json(payload)
+
+
+_payload_cache_version: Optional[Tuple[int, int]] = None
+
+
+def build_payload_bytes(
+    date_from: str,
+    date_to: Optional[str],
+    code: str,
+    limit: int
+) -> bytes:
+    """库文件版本变化后先清空旧版本的缓存条目，它们不会再被命中，不必等 LRU 慢慢挤出"""
+    global _payload_cache_version
+    version = db_file_version()
+    if version != _payload_cache_version:
+        _build_payload_cached.cache_clear()
+        _payload_cache_version = version
+    return _build_payload_cached(date_from, date_to, code, limit, version)
+
+
 @app.get("/", response_class=HTMLResponse)
 def index(request: Request):
     # 页面初始化：给到可选日期范围
@@ -398,5 +575,6 @@ def api_dashboard(
     code: str = Query("", description="按代码模糊过滤，可空"),
     limit: int = Query(500, ge=1, le=5000)
 ):
-    payload = build_dashboard_payload(date_from=date_from, date_to=date_to, code=code, limit=limit)
-    return JSONResponse(payload)
+    # 缓存键只用库文件版本（两次 stat）：buyback/ak_plans 的任何写入都会改变它，请求路径上不再查表
+    body = build_payload_bytes(date_from, date_to, code, limit)
+    return Response(content=body, media_type="application/json")
@@ -1,6 +1,6 @@
 # fetch_incremental.py
 import importlib.util
-import json, sqlite3, pandas as pd, requests, re, time
+import json, sqlite3, numpy as np, pandas as pd, requests, time
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -10,7 +10,11 @@ CFG = BASE_DIR / "repurchase_params.json"
 INCREMENT_CSV = RESULT_DIR / "repurchase_increment.csv"
 LOADER_PATH = BASE_DIR / "load_to_db.py"
 UA="Mozilla/5.0"
-JSONP_RE=re.compile(r'^[\w$]+\((.*)\)\s*;?\s*$')
+try:
+    import orjson
+    _json_loads=orjson.loads
+except ImportError:
+    _json_loads=json.loads
 
 def ensure_result_dir():
     RESULT_DIR.mkdir(parents=True, exist_ok=True)
@@ -31,17 +35,25 @@ def normalize_code_value(value):
         return s.zfill(6)
     return s
 
+def normalize_code_column(values):
+    # 相同取值只规范化一次，缺失值原样保留
+    codes, uniques=pd.factorize(values)
+    mapped=np.array([normalize_code_value(v) for v in uniques]+[None], dtype=object)
+    return pd.Series(mapped[codes], index=values.index, dtype=object).where(codes!=-1, values)
+
 def normalize_codes(df: pd.DataFrame) -> pd.DataFrame:
     for col in ["SCODE","股票代码","SECURITY_CODE","code","CODE"]:
         if col in df.columns:
-            df[col] = df[col].apply(normalize_code_value)
+            df[col] = normalize_code_column(df[col])
     return df
 
-def parse(text):
-    t=text.strip()
-    if t and t[0] in "{[": import json as j; return j.loads(t)
-    m=JSONP_RE.match(t); import json as j
-    return j.loads(m.group(1)) if m else {}
+def parse(content):
+    # 直接解析响应字节，省去 r.text 的解码；装了 orjson 时用其 C 解析器
+    t=content.strip()
+    if t[:1] in (b"{", b"["): return _json_loads(t)
+    # JSONP：callback(...); 直接按首个 "(" 与最后一个 ")" 切片，不走正则
+    lp, rp=t.find(b"("), t.rfind(b")")
+    return _json_loads(t[lp+1:rp]) if 0<lp<rp else {}
 
 def max_date():
     ensure_result_dir()
@@ -61,32 +73,41 @@ def max_date():
             PRIMARY KEY(code,plan_key,date)
         );
     """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bb_date_code ON buyback(date, code)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bb_code_date ON buyback(code, date)")
+    conn.commit()
     c.execute("SELECT MAX(date) FROM buyback"); row=c.fetchone(); conn.close()
     return row[0] or "2000-01-01"
 
 def fetch_since(api_base, params, referer, since_date):
     headers={"User-Agent":UA,"Accept":"application/json, text/javascript, */*; q=0.01","Referer":referer}
     base=dict(params); base.pop("callback", None)
+    # 接口按该列倒序分页时，整页都早于 since_date 即可停止，后续页只会更早
+    sort_col=str(base.get("sortColumns","")).upper() if str(base.get("sortTypes",""))=="-1" else None
     out=[]
-    for p in range(1,30):
-        q=dict(base); q["pageNumber"]=str(p)
-        r=requests.get(api_base, params=q, headers=headers, timeout=15)
-        j=parse(r.text)
-        res=(j.get("result") or j.get("data",{}).get("result") or {})
-        data=res.get("data") or []
-        if not data: break
-        df=normalize_codes(pd.DataFrame(data))
-        # 只保留 >= since_date 的
-        dt_col=None
-        for cand in ["TDATE","JLRQ","NOTICE_DATE","ANNOUNCE_DATE"]:
-            if cand in df.columns: dt_col=cand; break
-        if dt_col:
-            dfx=df[pd.to_datetime(df[dt_col], errors="coerce").dt.strftime("%Y-%m-%d") >= since_date]
-        else:
-            dfx=df
-        out.append(dfx)
-        if len(df)<int(q.get("pageSize", base.get("pageSize", "200"))): break
-        time.sleep(0.7)
+    with requests.Session() as session:
+        session.headers.update(headers)
+        for p in range(1,30):
+            q=dict(base); q["pageNumber"]=str(p)
+            r=session.get(api_base, params=q, timeout=15)
+            j=parse(r.content)
+            res=(j.get("result") or j.get("data",{}).get("result") or {})
+            data=res.get("data") or []
+            if not data: break
+            df=normalize_codes(pd.DataFrame(data))
+            # 只保留 >= since_date 的
+            dt_col=None
+            for cand in ["TDATE","JLRQ","NOTICE_DATE","ANNOUNCE_DATE"]:
+                if cand in df.columns: dt_col=cand; break
+            if dt_col:
+                keep=pd.to_datetime(df[dt_col], errors="coerce").dt.strftime("%Y-%m-%d") >= since_date
+                dfx=df[keep]
+            else:
+                dfx=df
+            out.append(dfx)
+            if len(df)<int(q.get("pageSize", base.get("pageSize", "200"))): break
+            if dt_col and dt_col==sort_col and not keep.any(): break
+            time.sleep(0.7)
     return pd.concat(out, ignore_index=True) if out else pd.DataFrame()
 
 def run_loader():
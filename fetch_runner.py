@@ -1,15 +1,30 @@
 # fetch_runner.py
-import json, time, re
+import json, time
+import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 UA = "Mozilla/5.0"
-JSONP_RE = re.compile(r'^[\w$]+\((.*)\)\s*;?\s*$')
 BASE_DIR = Path(__file__).resolve().parent
 RESULT_DIR = BASE_DIR / "result"
 PARAMS_PATH = BASE_DIR / "repurchase_params.json"
 LATEST_CSV = RESULT_DIR / "repurchase_latest.csv"
+LATEST_PARQUET = LATEST_CSV.with_suffix(".parquet")
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# 所有分页请求共用一个 Session：复用 keep-alive 连接，连接池大小覆盖 fetch_all 的并发数
+SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(total=3, backoff_factor=0.5))
+SESSION.mount("https://", _ADAPTER)
+SESSION.mount("http://", _ADAPTER)
 
 def normalize_code_value(value):
     if pd.isna(value):
@@ -27,37 +42,66 @@ def normalize_code_value(value):
         return s.zfill(6)
     return s
 
-def parse_json_maybe_jsonp(text: str):
-    t = text.strip()
-    if t and t[0] in "{[":
-        return json.loads(t)
-    m = JSONP_RE.match(t)
-    if not m:
+def normalize_code_column(values: pd.Series) -> pd.Series:
+    """normalize_code_value 的整列版本：相同取值只规范化一次，缺失值原样保留"""
+    codes, uniques = pd.factorize(values)
+    mapped = np.array([normalize_code_value(v) for v in uniques] + [None], dtype=object)
+    return pd.Series(mapped[codes], index=values.index, dtype=object).where(codes != -1, values)
+
+def parse_json_maybe_jsonp(content):
+    """接受 bytes（r.content）或 str；orjson 直接解析 bytes，省掉一次解码"""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    t = content.strip()
+    if t[:1] in (b"{", b"["):
+        return _json_loads(t)
+    # JSONP：callback(...); 直接按首个 "(" 与最后一个 ")" 切片，不走正则
+    lp, rp = t.find(b"("), t.rfind(b")")
+    if lp <= 0 or rp <= lp:
         raise ValueError("not json/jsonp")
-    import json as _j
-    return _j.loads(m.group(1))
+    return _json_loads(t[lp+1:rp])
 
-def fetch_all(api_base, params, referer, max_pages=20, sleep_s=0.8):
-    headers = {"User-Agent": UA, "Accept": "application/json, text/javascript, */*; q=0.01", "Referer": referer}
+def _fetch_page(api_base, params, headers, p):
     base = dict(params); base.pop("callback", None)
-    frames=[]
-    for p in range(1, max_pages+1):
-        q = dict(base); q["pageNumber"]=str(p)
-        r = requests.get(api_base, params=q, headers=headers, timeout=15)
-        try:
-            j = parse_json_maybe_jsonp(r.text)
-        except Exception:
-            # 尝试带 callback
-            r2 = requests.get(api_base, params={**params, "pageNumber": str(p)}, headers=headers, timeout=15)
-            j = parse_json_maybe_jsonp(r2.text)
-        res = (j or {}).get("result") or (j or {}).get("data", {}).get("result") or {}
-        data = res.get("data") or []
-        df = pd.DataFrame(data)
-        if df.empty: break
-        frames.append(df)
-        if len(df) < int(q.get("pageSize", params.get("pageSize", "200"))): break
-        time.sleep(sleep_s)
-    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    q = dict(base); q["pageNumber"]=str(p)
+    r = SESSION.get(api_base, params=q, headers=headers, timeout=15)
+    try:
+        j = parse_json_maybe_jsonp(r.content)
+    except Exception:
+        # 尝试带 callback
+        r2 = SESSION.get(api_base, params={**params, "pageNumber": str(p)}, headers=headers, timeout=15)
+        j = parse_json_maybe_jsonp(r2.content)
+    res = (j or {}).get("result") or (j or {}).get("data", {}).get("result") or {}
+    return res.get("data") or []
+
+def fetch_all(api_base, params, referer, max_pages=20, sleep_s=0.8, max_workers=3):
+    headers = {"User-Agent": UA, "Accept": "application/json, text/javascript, */*; q=0.01", "Referer": referer}
+    page_size = int(params.get("pageSize", "200"))
+    # 第一页串行：不满一页就没有后续页了
+    data = _fetch_page(api_base, params, headers, 1)
+    rows = list(data)
+    if len(data) < page_size:
+        return pd.DataFrame(rows)
+    # 其余页逐个提交给小线程池：相邻两次提交之间仍间隔 sleep_s，请求频率与串行版一致，
+    # 只是慢响应不再阻塞下一页；一旦已返回的页里出现空页/短页就不再提交
+    futures = {}
+    last_page = max_pages
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for p in range(2, max_pages+1):
+            time.sleep(sleep_s)
+            for q, fut in futures.items():
+                if q < last_page and fut.done() and len(fut.result()) < page_size:
+                    last_page = q
+            if p > last_page:
+                break
+            futures[p] = pool.submit(_fetch_page, api_base, params, headers, p)
+        # 按页序累积原始记录，遇到第一页短页即止；最后一次性构造 DataFrame
+        for p in sorted(futures):
+            data = futures[p].result()
+            rows.extend(data)
+            if len(data) < page_size:
+                break
+    return pd.DataFrame(rows)
 
 def normalize(df: pd.DataFrame) -> pd.DataFrame:
     m = {
@@ -83,7 +127,7 @@ def normalize(df: pd.DataFrame) -> pd.DataFrame:
             df[v]=df[k]
     for col in ["股票代码","SCODE","SECURITY_CODE"]:
         if col in df.columns:
-            df[col] = df[col].apply(normalize_code_value)
+            df[col] = normalize_code_column(df[col])
     return df
 
 if __name__ == "__main__":
@@ -93,4 +137,10 @@ if __name__ == "__main__":
     df = fetch_all(cfg["api_base"], cfg["params"], cfg["referer"], max_pages=20, sleep_s=0.7)
     df = normalize(df)
     df.to_csv(LATEST_CSV, index=False, encoding="utf-8-sig")
+    # 同时写一份 parquet 供 load_to_db 直接读取（列式、无需再解析 CSV）；写失败（如未装 pyarrow）不影响 CSV
+    try:
+        # 接口返回的 object 列常混有数字/字符串/None，统一存为可空 string
+        df.astype({c: "string" for c in df.columns if df[c].dtype == object}).to_parquet(LATEST_PARQUET, index=False)
+    except Exception as exc:
+        print(f"[WARN] 写入 {LATEST_PARQUET.name} 失败: {exc}")
     print(f"CSV updated: {LATEST_CSV}, rows={len(df)}")
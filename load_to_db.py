@@ -1,5 +1,5 @@
 # load_to_db.py
-import sqlite3, pandas as pd
+import csv, functools, sqlite3, numpy as np, pandas as pd
 from pathlib import Path
 from typing import Any, Dict, Optional, Tuple
 
@@ -31,39 +31,171 @@ CREATE TABLE IF NOT EXISTS buyback (
 );
 """
 
+# legacy 占位键的匹配条件；以字面量写进 SQL，查询条件与部分索引的 WHERE 完全一致时规划器才会选用该索引
+LEGACY_KEY_FILTER = f"plan_key GLOB '{LEGACY_PLAN_PREFIX}*'"
+
+BUYBACK_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS idx_bb_date_code ON buyback(date, code)",
+    "CREATE INDEX IF NOT EXISTS idx_bb_code_date ON buyback(code, date)",
+    # 部分索引只收录 legacy 行：回填/清理时按它扫描，代价与 legacy 行数成正比而非全表
+    f"CREATE INDEX IF NOT EXISTS idx_bb_legacy ON buyback(code, date, plan_key) WHERE {LEGACY_KEY_FILTER}",
+)
+
+BUYBACK_LEGACY_ROWS_SQL = f"SELECT rowid, code, plan_key, date FROM buyback WHERE {LEGACY_KEY_FILTER}"
+
+BUYBACK_STAGE_SQL = """
+CREATE TEMP TABLE buyback_stage(
+  code, plan_key, name, date, amount, volume, avg_price, progress, start_date, end_date
+)
+"""
+
+# 暂存表无约束，executemany 只做纯追加；合并时一条 INSERT ... SELECT 完成冲突处理
+# （WHERE true 用于消除 SELECT 后接 ON CONFLICT 时的语法歧义）
+BUYBACK_MERGE_SQL = """
+INSERT INTO buyback(code,plan_key,name,date,amount,volume,avg_price,progress,start_date,end_date)
+SELECT code,plan_key,name,date,amount,volume,avg_price,progress,start_date,end_date
+FROM temp.buyback_stage WHERE true
+ON CONFLICT(code,plan_key,date) DO UPDATE SET
+    name=excluded.name,
+    amount=COALESCE(excluded.amount,buyback.amount),
+    volume=COALESCE(excluded.volume,buyback.volume),
+    avg_price=COALESCE(excluded.avg_price,buyback.avg_price),
+    progress=COALESCE(excluded.progress,buyback.progress),
+    start_date=COALESCE(excluded.start_date,buyback.start_date),
+    end_date=COALESCE(excluded.end_date,buyback.end_date)
+"""
+
+BUYBACK_STAGE_INSERT_SQL = "INSERT INTO temp.buyback_stage VALUES(?,?,?,?,?,?,?,?,?,?)"
+
+BUYBACK_INSERT_SQL = """
+INSERT INTO buyback(code,plan_key,name,date,amount,volume,avg_price,progress,start_date,end_date)
+VALUES(?,?,?,?,?,?,?,?,?,?)
+"""
+
+BUYBACK_REKEY_SQL = "UPDATE OR IGNORE buyback SET plan_key = ? WHERE rowid = ?"
+BUYBACK_DROP_UNMOVED_SQL = "DELETE FROM buyback WHERE plan_key <> ? AND rowid = ?"
+
+# 相关子查询强制走 (code, date) 索引：没有统计信息时规划器会选主键 (code=?)，
+# 对每条 legacy 行扫描该代码的全部记录，大库上慢一个数量级以上
+BUYBACK_LEGACY_CLEANUP_SQL = f"""
+DELETE FROM buyback
+WHERE {LEGACY_KEY_FILTER}
+  AND EXISTS (
+    SELECT 1 FROM buyback AS newer INDEXED BY idx_bb_code_date
+    WHERE newer.code = buyback.code
+      AND newer.date = buyback.date
+      AND newer.plan_key <> buyback.plan_key
+)
+"""
+
+# 源 CSV 中各字段的候选列名（按优先级），normalize_types 依次补缺
+SOURCE_COLUMNS: Dict[str, list[str]] = {
+    "code": ["股票代码", "SECURITY_CODE", "SCODE"],
+    "name": ["股票简称", "SECURITY_NAME_ABBR", "SNAME"],
+    "date": ["披露日期", "记录日期", "公告日期", "TDATE", "JLRQ", "NOTICE_DATE", "ANNOUNCE_DATE"],
+    "amount": ["已回购金额", "BUYBACK_AMT", "HGJE"],
+    "volume": ["已回购数量", "BUYBACK_VOL", "HGSL"],
+    "avg_price": ["已回购均价", "HGZDJ"],
+    "progress": ["回购进度", "REPURCHASE_PROGRESS"],
+    "start_date": ["回购开始日期", "START_DATE"],
+    "end_date": ["回购截止日期", "END_DATE"],
+    "plan_key": ["计划编号", "PLAN_CODE", "PLAN_ID", "REPURCHASE_PLAN_ID", "REPURCHASE_ID", "BUYBACK_PLAN_CODE"],
+}
+_SOURCE_COLUMN_NAMES = frozenset(c for cols in SOURCE_COLUMNS.values() for c in cols)
+
+
+def _as_text_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """与 pd.read_csv(dtype=str) 对齐：取值统一为文本，缺失值保持 NaN。
+    单独 astype(str) 在 pandas < 3 会把 None/NaN 变成字符串 'None'/'nan'，因此再用 notna 掩码还原缺失"""
+    return df.astype(str).where(df.notna())
+
+
+def _read_parquet_sidecar(path: Path) -> Optional[pd.DataFrame]:
+    """fetch_runner 会在 CSV 旁写一份同名 parquet；仅当它不比 CSV 旧时使用，读取失败（如未装 pyarrow）返回 None"""
+    sidecar = path.with_suffix(".parquet")
+    if not sidecar.exists() or sidecar.stat().st_mtime < path.stat().st_mtime:
+        return None
+    try:
+        import pyarrow.parquet as pq
+        columns = [c for c in pq.read_schema(sidecar).names if c in _SOURCE_COLUMN_NAMES]
+        # 与 CSV 分支保持一致：全部为文本列，缺失值为 NaN
+        return _as_text_frame(pd.read_parquet(sidecar, columns=columns))
+    except Exception as exc:
+        print(f"[WARN] 读取 {sidecar.name} 失败，改读 CSV: {exc}")
+        return None
+
+
+# pd.read_csv 默认识别为缺失值的字符串；pyarrow 读取时使用同一套，保证两条路径结果一致
+_CSV_NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+
+def _read_csv_arrow(path: Path) -> Optional[pd.DataFrame]:
+    """用 pyarrow 的多线程 CSV 解析器读取源文件；未安装 pyarrow 或文件不规整（重复列名、列数不齐等）时返回 None"""
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            header = next(csv.reader(f))
+        if len(set(header)) != len(header):
+            return None
+        columns = [c for c in header if c in _SOURCE_COLUMN_NAMES]
+        table = pacsv.read_csv(path, convert_options=pacsv.ConvertOptions(
+            include_columns=columns,
+            column_types={c: pa.string() for c in columns},
+            null_values=_CSV_NA_VALUES,
+            strings_can_be_null=True,
+        ))
+        return _as_text_frame(table.to_pandas())
+    except Exception:
+        return None
+
+
+def read_source_csv(path: Path) -> pd.DataFrame:
+    """只读 normalize_types 会用到的列，且全部按文本读入，省去其余列的解析与类型推断"""
+    df = _read_parquet_sidecar(path)
+    if df is None:
+        df = _read_csv_arrow(path)
+    if df is not None:
+        return df
+    return pd.read_csv(path, usecols=lambda c: c in _SOURCE_COLUMN_NAMES, dtype=str)
+
 
 def ensure_result_dir() -> None:
     RESULT_DIR.mkdir(parents=True, exist_ok=True)
 
 
 def ensure_buyback_table(conn: sqlite3.Connection) -> None:
+    """建表/迁移/建索引；不自行提交，由调用方（load_to_db）的外层事务统一提交或回滚"""
     cur = conn.cursor()
     cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='buyback'")
     has_table = cur.fetchone() is not None
-    if not has_table:
-        cur.executescript(schema)
-        conn.commit()
-        return
-
-    cur.execute("PRAGMA table_info(buyback)")
-    info = cur.fetchall()
-    columns = {col[1] for col in info}
-    if "plan_key" in columns:
-        return
-    has_plan_code = "plan_code" in columns
-
-    # legacy schema migration: replace plan_code -> plan_key while keeping historical rows
-    cur.execute("ALTER TABLE buyback RENAME TO buyback_legacy")
-    conn.commit()
-    cur.executescript(schema)
-    conn.commit()
-    if has_plan_code:
+    if has_table:
+        cur.execute("PRAGMA table_info(buyback)")
+        columns = {col[1] for col in cur.fetchall()}
+        if "plan_key" in columns:
+            for stmt in BUYBACK_INDEX_SQL:
+                cur.execute(stmt)
+            return
+        has_plan_code = "plan_code" in columns
+        plan_key_expr = "COALESCE(NULLIF(plan_code,''), ? || COALESCE(NULLIF(code,''), 'UNKNOWN'))" if has_plan_code \
+            else "? || COALESCE(NULLIF(code,''), 'UNKNOWN')"
+
+    # 建表与 legacy 迁移（plan_code -> plan_key，保留历史行）跟随外层事务：中途失败整体回滚。
+    # executescript 会先提交，因此逐条执行
+    if has_table:
+        cur.execute("ALTER TABLE buyback RENAME TO buyback_legacy")
+    cur.execute(schema)
+    if has_table:
         cur.execute(
-            """
+            f"""
             INSERT INTO buyback(code, plan_key, name, date, amount, volume, avg_price, progress, start_date, end_date)
             SELECT
                 code,
-                COALESCE(NULLIF(plan_code,''), ? || COALESCE(NULLIF(code,''), 'UNKNOWN')),
+                {plan_key_expr},
                 name,
                 date,
                 amount,
@@ -76,28 +208,11 @@ def ensure_buyback_table(conn: sqlite3.Connection) -> None:
             """,
             (LEGACY_PLAN_PREFIX,),
         )
-    else:
-        cur.execute(
-            """
-            INSERT INTO buyback(code, plan_key, name, date, amount, volume, avg_price, progress, start_date, end_date)
-            SELECT
-                code,
-                ? || COALESCE(NULLIF(code,''), 'UNKNOWN'),
-                name,
-                date,
-                amount,
-                volume,
-                avg_price,
-                progress,
-                start_date,
-                end_date
-            FROM buyback_legacy
-            """,
-            (LEGACY_PLAN_PREFIX,),
-        )
-    conn.commit()
-    cur.execute("DROP TABLE IF EXISTS buyback_legacy")
-    conn.commit()
+        cur.execute("DROP TABLE buyback_legacy")
+    # 索引在数据导入后再建；旧表上的同名索引已随 DROP 一并删除
+    for stmt in BUYBACK_INDEX_SQL:
+        cur.execute(stmt)
+
 
 def normalize_existing_buyback_codes(conn: sqlite3.Connection) -> tuple[int, int]:
     try:
@@ -107,24 +222,32 @@ def normalize_existing_buyback_codes(conn: sqlite3.Connection) -> tuple[int, int
     if df.empty:
         return (0, 0)
     before = len(df)
-    df["code"] = df["code"].apply(normalize_code_value)
+    df["code"] = normalize_code_series(df["code"])
     df = df.dropna(subset=["code", "date"])
     df = df.drop_duplicates(subset=["code", "plan_key", "date"], keep="last")
+    # 规范化后的代码会打乱原有顺序，按主键排序后再整表重写
+    df = df.sort_values(["code", "plan_key", "date"], kind="mergesort")
 
     cur = conn.cursor()
+    # 删除与重写在同一个外层事务里，不会留下被清空的中间状态
     cur.execute("DELETE FROM buyback")
-    conn.commit()
-    cur.executemany("""
-            INSERT INTO buyback(code,plan_key,name,date,amount,volume,avg_price,progress,start_date,end_date)
-            VALUES(?,?,?,?,?,?,?,?,?,?)
-    """, list(df.itertuples(index=False, name=None)))
-    conn.commit()
+    cur.executemany(BUYBACK_INSERT_SQL, df.itertuples(index=False, name=None))
     return (before, len(df))
 
 
 def normalize_code_value(value: Any) -> Any:
     if pd.isna(value):
         return pd.NA
+    # 股票代码取值很少，各步骤（源数据、计划表、历史行）反复规范化同一批代码：按取值缓存结果
+    try:
+        return _normalize_code_cached(value)
+    except TypeError:
+        return _normalize_code_cached.__wrapped__(value)
+
+
+@functools.lru_cache(maxsize=8192)
+def _normalize_code_cached(value: Any) -> Any:
+    # 相等的数值（1、1.0、True）哈希相同会共用缓存项，它们规范化的结果本来就一致
     if isinstance(value, (int, float)):
         if float(value).is_integer():
             return f"{int(value):06d}"
@@ -132,6 +255,9 @@ def normalize_code_value(value: Any) -> Any:
     value_str = str(value).strip()
     if not value_str:
         return pd.NA
+    # 最常见的纯 ASCII 数字代码直接补零，不走 float 解析（过长的数字串留给下面按 float 处理以保持原有结果）
+    if value_str.isascii() and value_str.isdigit() and len(value_str) <= 15:
+        return f"{int(value_str):06d}"
     try:
         numeric = float(value_str)
         if numeric.is_integer():
@@ -143,17 +269,69 @@ def normalize_code_value(value: Any) -> Any:
     return value_str.upper()
 
 
+def _map_unique(values: pd.Series, func) -> pd.Series:
+    """代码/计划编号重复度很高：相同取值只调用一次 func，再按 factorize 编码展开"""
+    codes, uniques = pd.factorize(values)
+    # 末尾追加 NA，缺失值的编码 -1 正好取到它
+    mapped = np.array([func(v) for v in uniques] + [pd.NA], dtype=object)
+    return pd.Series(mapped[codes], index=values.index, dtype=object)
+
+
+def normalize_code_series(values: pd.Series) -> pd.Series:
+    return _map_unique(values, normalize_code_value)
+
+
+def _parse_unique_dates(values: pd.Series) -> tuple[np.ndarray, pd.Series]:
+    """日期同样高度重复：只对去重后的取值做 to_datetime（格式推断最耗时），返回 factorize 编码与解析结果"""
+    codes, uniques = pd.factorize(values)
+    return codes, pd.to_datetime(pd.Series(uniques, dtype=object), errors="coerce")
+
+
+def parse_date_series(values: pd.Series) -> pd.Series:
+    codes, parsed = _parse_unique_dates(values)
+    # 编码 -1（缺失值）在 allow_fill 下取到 NaT
+    return pd.Series(parsed.array.take(codes, allow_fill=True), index=values.index)
+
+
+def format_date_series(values: pd.Series) -> pd.Series:
+    """解析并格式化成 YYYY-MM-DD；strftime 也只对去重后的取值做，缺失/无法解析的为 NaN"""
+    codes, parsed = _parse_unique_dates(values)
+    text = parsed.dt.strftime("%Y-%m-%d")
+    return pd.Series(text.array.take(codes, allow_fill=True), index=values.index)
+
+
+def normalize_plan_value(value: Any) -> Any:
+    if pd.isna(value):
+        return pd.NA
+    value_str = str(value).strip()
+    if not value_str:
+        return pd.NA
+    # convert float-like strings (e.g. "12345.0") into integers
+    try:
+        numeric = float(value_str)
+        if numeric.is_integer():
+            return f"{int(numeric)}"
+    except ValueError:
+        pass
+    return value_str
+
+
+def normalize_plan_series(values: pd.Series) -> pd.Series:
+    return _map_unique(values, normalize_plan_value)
+
+
 def load_plan_reference(conn: sqlite3.Connection) -> pd.DataFrame:
+    # ak_plans 可能不存在：用游标直接查询，失败时不会像 pd.read_sql_query 那样回滚调用方的外层事务
     try:
-        plans = pd.read_sql_query(
+        cur = conn.execute(
             """
             SELECT code, plan_key, version, announce_date, start_date,
                    price_lower, price_upper, amount_upper, volume_upper,
                    latest_price, progress_text
             FROM ak_plans
-            """,
-            conn,
+            """
         )
+        plans = pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
     except Exception:
         plans = pd.DataFrame()
 
@@ -171,7 +349,7 @@ def load_plan_reference(conn: sqlite3.Connection) -> pd.DataFrame:
     if plans.empty:
         return plans
 
-    plans["code"] = plans["code"].apply(normalize_code_value)
+    plans["code"] = normalize_code_series(plans["code"])
     plans["plan_key"] = plans["plan_key"].fillna("").astype(str).str.strip()
     plans = plans[plans["plan_key"] != ""]
     if plans.empty:
@@ -193,32 +371,52 @@ def load_plan_reference(conn: sqlite3.Connection) -> pd.DataFrame:
     return plans
 
 
-def build_plan_lookup(plan_df: pd.DataFrame) -> Dict[str, list[dict[str, Any]]]:
+PlanLookup = Dict[str, Dict[str, np.ndarray]]
+
+
+def _as_datetime(values: Any) -> Any:
+    """load_plan_reference 已解析成 datetime64 的列直接复用，其余输入再 to_datetime"""
+    if isinstance(values, pd.Series) and pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return pd.to_datetime(values, errors="coerce")
+
+
+def build_plan_lookup(plan_df: pd.DataFrame) -> PlanLookup:
+    """按代码切分计划表：每个代码一组按 (公告日, plan_key) 排好序的数组，不再为每个计划生成 dict"""
     if plan_df.empty:
         return {}
 
-    plans = plan_df.copy()
-    plans["code"] = plans["code"].apply(normalize_code_value)
+    # 只取切分需要的列，价格/进度等其余列不随之复制
+    plans = plan_df[[c for c in ("code", "plan_key", "announce_date", "start_date") if c in plan_df.columns]]
+    plans = plans.assign(code=normalize_code_series(plans["code"]))
     plans = plans.dropna(subset=["code"])
     if plans.empty:
         return {}
 
     plans = plans.rename(columns={"announce_date": "announce_dt"})
-    plans["announce_dt"] = pd.to_datetime(plans["announce_dt"], errors="coerce")
-    plans["start_dt"] = pd.to_datetime(plans.get("start_date"), errors="coerce")
+    plans["announce_dt"] = _as_datetime(plans["announce_dt"])
+    plans["start_dt"] = _as_datetime(plans.get("start_date"))
     plans = plans.dropna(subset=["announce_dt"])
     if plans.empty:
         return {}
 
     plans = plans.sort_values(["code", "announce_dt", "plan_key"], kind="mergesort").reset_index(drop=True)
 
-    plan_dict: Dict[str, list[dict[str, Any]]] = {}
-    for code, group in plans.groupby("code", sort=False):
-        plan_dict[str(code)] = group.to_dict("records")
-    return plan_dict
-
-
-def resolve_plan_key(code: Any, date_val: Any, plan_lookup: Dict[str, list[dict[str, Any]]]) -> Optional[str]:
+    codes = plans["code"].astype(str).to_numpy()
+    announce = plans["announce_dt"].to_numpy()
+    start = plans["start_dt"].to_numpy()
+    keys = plans["plan_key"].to_numpy(dtype=object)
+    # 已按 code 排序，同一代码的计划是连续区间
+    bounds = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(codes)]))
+    return {
+        codes[lo]: {"announce_dt": announce[lo:hi], "start_dt": start[lo:hi], "plan_key": keys[lo:hi]}
+        for lo, hi in zip(starts, ends)
+    }
+
+
+def resolve_plan_key(code: Any, date_val: Any, plan_lookup: PlanLookup) -> Optional[str]:
     if not plan_lookup:
         return None
     code_val = normalize_code_value(code)
@@ -230,142 +428,159 @@ def resolve_plan_key(code: Any, date_val: Any, plan_lookup: Dict[str, list[dict[
     dt = pd.to_datetime(date_val, errors="coerce")
     if pd.isna(dt):
         return None
-    for plan in reversed(candidates):
-        ann = plan.get("announce_dt")
-        if pd.isna(ann) or ann > dt:
-            continue
-        start_dt = plan.get("start_dt")
-        if pd.notna(start_dt) and start_dt > dt:
-            continue
-        chosen_key = plan.get("plan_key")
-        if chosen_key:
-            return chosen_key
+    dt = dt.to_datetime64()
+    announce, start, keys = candidates["announce_dt"], candidates["start_dt"], candidates["plan_key"]
+    # 公告日不晚于当天的最后一个位置，再向前跳过尚未开始的计划
+    i = int(np.searchsorted(announce, dt, side="right")) - 1
+    while i >= 0:
+        if not (start[i] > dt) and keys[i]:
+            return keys[i]
+        i -= 1
     return None
 
 
-def assign_plan_keys(buy_df: pd.DataFrame, plan_lookup: Dict[str, list[dict[str, Any]]]) -> pd.DataFrame:
-    if buy_df.empty or not plan_lookup:
-        return buy_df
+def _plan_lookup_frame(plan_lookup: PlanLookup) -> pd.DataFrame:
+    """把 plan_lookup 摊平成 merge_asof 用的右表：(code, eff_dt, best_key)
+
+    resolve_plan_key 取的是“公告日、开始日都不晚于当天”的计划里按 (公告日, plan_key) 排序最靠后的一个。
+    记计划生效日 eff_dt = max(公告日, 开始日)，按 eff_dt 排序后对排序位次做累计最大，
+    则 eff_dt <= 当天的最后一行即给出该计划。
+    """
+    groups = list(plan_lookup.items())
+    frame = pd.DataFrame({
+        "code": np.repeat([code for code, _ in groups], [len(g["plan_key"]) for _, g in groups]),
+        "rank": np.concatenate([np.arange(len(g["plan_key"])) for _, g in groups]),
+        "announce_dt": np.concatenate([g["announce_dt"] for _, g in groups]),
+        "start_dt": np.concatenate([g["start_dt"] for _, g in groups]),
+        "plan_key": np.concatenate([g["plan_key"] for _, g in groups]),
+    })
+    frame = frame[frame["announce_dt"].notna() & frame["plan_key"].map(bool)]
+    frame["eff_dt"] = frame[["announce_dt", "start_dt"]].max(axis=1).astype("datetime64[ns]")
+    frame = frame.sort_values(["code", "eff_dt", "rank"], kind="mergesort")
+    frame["best"] = frame.groupby("code", sort=False)["rank"].cummax()
+    keys = frame[["code", "rank", "plan_key"]].rename(columns={"rank": "best", "plan_key": "best_key"})
+    frame = frame.merge(keys, on=["code", "best"], how="left")
+    return frame[["code", "eff_dt", "best", "best_key"]].sort_values(["eff_dt", "best"], kind="mergesort")
 
-    work = buy_df.reset_index(drop=True).copy()
-    work["plan_key"] = work["plan_key"].fillna("").astype(str).str.strip()
-    work["code"] = work["code"].apply(normalize_code_value)
-    work["date_dt"] = pd.to_datetime(work["date"], errors="coerce")
 
-    for idx, row in work.iterrows():
-        chosen_key = resolve_plan_key(row.get("code"), row.get("date_dt"), plan_lookup)
-        if chosen_key:
-            work.at[idx, "plan_key"] = chosen_key
+def assign_plan_keys(buy_df: pd.DataFrame, plan_lookup: PlanLookup) -> pd.DataFrame:
+    if buy_df.empty or not plan_lookup:
+        return buy_df
 
-    work.drop(columns=["date_dt"], inplace=True)
+    # 调用方（normalize_types / rehydrate_existing_plan_keys）已规范化 code、补齐 plan_key，这里不再重复处理
+    # reset_index 已返回新对象，后面只改写 plan_key 列，不再整表复制
+    work = buy_df.reset_index(drop=True)
+    date_dt = parse_date_series(work["date"])
+
+    valid = work["code"].notna() & date_dt.notna()
+    plans = _plan_lookup_frame(plan_lookup)
+    if not valid.any() or plans.empty:
+        return work
+
+    # 同一 (code, 日期) 的多行（latest 与 increment 重叠等）只参与一次匹配，结果再按编码展开
+    code_ids, code_uniques = pd.factorize(work.loc[valid, "code"])
+    date_ids, date_uniques = pd.factorize(date_dt[valid].astype("datetime64[ns]"))
+    pair_ids, pair_uniques = pd.factorize(code_ids.astype(np.int64) * len(date_uniques) + date_ids)
+    left = pd.DataFrame({
+        "pair": np.arange(len(pair_uniques)),
+        "code": np.asarray(code_uniques.astype(str), dtype=object)[pair_uniques // len(date_uniques)],
+        "date_dt": np.asarray(date_uniques)[pair_uniques % len(date_uniques)],
+    }).sort_values("date_dt", kind="mergesort")
+    merged = pd.merge_asof(
+        left, plans, left_on="date_dt", right_on="eff_dt", by="code", direction="backward"
+    )
+    best_key = np.empty(len(pair_uniques), dtype=object)
+    best_key[merged["pair"].to_numpy()] = merged["best_key"].to_numpy(dtype=object)
+    row_key = best_key[pair_ids]
+    hit = pd.notna(row_key)
+    work.loc[work.index[valid][hit], "plan_key"] = row_key[hit]
     return work
 
 
 def rehydrate_existing_plan_keys(
     conn: sqlite3.Connection,
-    plan_lookup: Dict[str, list[dict[str, Any]]]
+    plan_lookup: PlanLookup
 ) -> Tuple[int, int]:
     if not plan_lookup:
         return (0, 0)
 
-    legacy_df = pd.read_sql_query(
-        "SELECT rowid, code, plan_key, date FROM buyback WHERE plan_key LIKE ?",
-        conn,
-        params=(f"{LEGACY_PLAN_PREFIX}%",),
-    )
+    legacy_df = pd.read_sql_query(BUYBACK_LEGACY_ROWS_SQL, conn)
     if legacy_df.empty:
         return (0, 0)
 
-    legacy_df["code"] = legacy_df["code"].apply(normalize_code_value)
+    legacy_df["code"] = normalize_code_series(legacy_df["code"])
     reassigned = assign_plan_keys(legacy_df, plan_lookup)
 
-    cur = conn.cursor()
-    updated = 0
-    deleted = 0
-    for row in reassigned.itertuples(index=False):
-        new_key = getattr(row, "plan_key", None)
-        if not isinstance(new_key, str) or not new_key or new_key.startswith(LEGACY_PLAN_PREFIX):
-            continue
-        code_val = getattr(row, "code", None)
-        date_val = getattr(row, "date", None)
-        rowid = getattr(row, "rowid")
-        if code_val is None or date_val is None:
-            continue
-        if pd.isna(code_val) or pd.isna(date_val):
-            continue
-        code_str = str(code_val)
-        date_str = str(date_val)
-        cur.execute(
-            "SELECT 1 FROM buyback WHERE code = ? AND plan_key = ? AND date = ?",
-            (code_str, new_key, date_str),
-        )
-        if cur.fetchone():
-            cur.execute("DELETE FROM buyback WHERE rowid = ?", (rowid,))
-            deleted += 1
-            continue
-        cur.execute("UPDATE buyback SET plan_key = ? WHERE rowid = ?", (new_key, rowid))
-        updated += 1
+    # plan_key 取自 TEXT NOT NULL 列或计划表的文本键，整列都是字符串，可直接用 .str 向量判断
+    new_keys = reassigned["plan_key"].astype(str)
+    valid = (
+        reassigned["plan_key"].notna()
+        & (new_keys != "")
+        & ~new_keys.str.startswith(LEGACY_PLAN_PREFIX)
+        & reassigned["code"].notna()
+        & reassigned["date"].notna()
+    )
+    moves = list(zip(new_keys[valid], reassigned.loc[valid, "rowid"].astype("int64")))
+    if not moves:
+        return (0, 0)
 
-    if updated or deleted:
-        conn.commit()
+    cur = conn.cursor()
+    # 按原顺序整批改键；目标 (code, plan_key, date) 已存在的行被 OR IGNORE 跳过，随后作为冗余删除
+    cur.executemany(BUYBACK_REKEY_SQL, moves)
+    updated = cur.rowcount
+    cur.executemany(BUYBACK_DROP_UNMOVED_SQL, moves)
+    deleted = cur.rowcount
     return (updated, deleted)
 
 
 def normalize_types(df: pd.DataFrame) -> pd.DataFrame:
+    # 同一字段的多个候选列可能同时存在（如合并后的 latest/increment 各用一种列名），只能逐列补缺，无法简单 rename。
+    # 索引相同，用 where 原地补缺代替 combine_first 的索引对齐；已无缺失时后面的候选列不再处理
     def coalesce(colnames):
         base = None
         for c in colnames:
             if c not in df.columns:
                 continue
             series = df[c]
-            base = series if base is None else base.combine_first(series)
+            if base is None:
+                base = series
+                continue
+            missing = base.isna()
+            if not missing.any():
+                break
+            base = base.where(~missing, series)
         if base is None:
             base = pd.Series(pd.NA, index=df.index)
         return base
 
-    code = coalesce(["股票代码","SECURITY_CODE","SCODE"])
-    name = coalesce(["股票简称","SECURITY_NAME_ABBR","SNAME"])
-    date = coalesce(["披露日期","记录日期","公告日期","TDATE","JLRQ","NOTICE_DATE","ANNOUNCE_DATE"])
-    amount = coalesce(["已回购金额","BUYBACK_AMT","HGJE"])
-    volume = coalesce(["已回购数量","BUYBACK_VOL","HGSL"])
-    avgp = coalesce(["已回购均价","HGZDJ"])
-    prog = coalesce(["回购进度","REPURCHASE_PROGRESS"])
-    sd = coalesce(["回购开始日期","START_DATE"])
-    ed = coalesce(["回购截止日期","END_DATE"])
-    plan = coalesce(["计划编号","PLAN_CODE","PLAN_ID","REPURCHASE_PLAN_ID","REPURCHASE_ID","BUYBACK_PLAN_CODE"])
+    code = coalesce(SOURCE_COLUMNS["code"])
+    name = coalesce(SOURCE_COLUMNS["name"])
+    date = coalesce(SOURCE_COLUMNS["date"])
+    amount = coalesce(SOURCE_COLUMNS["amount"])
+    volume = coalesce(SOURCE_COLUMNS["volume"])
+    avgp = coalesce(SOURCE_COLUMNS["avg_price"])
+    prog = coalesce(SOURCE_COLUMNS["progress"])
+    sd = coalesce(SOURCE_COLUMNS["start_date"])
+    ed = coalesce(SOURCE_COLUMNS["end_date"])
+    plan = coalesce(SOURCE_COLUMNS["plan_key"])
 
     def normalize_code(series):
         if series is None:
             return pd.Series(pd.NA, index=df.index, dtype="string")
-        return series.apply(normalize_code_value).astype("string")
+        return normalize_code_series(series).astype("string")
 
     # 日期列安全转换
     def safe_date(series):
         if series is None:
             return pd.Series([None] * len(df))
-        converted = pd.to_datetime(series, errors="coerce").dt.strftime("%Y-%m-%d")
+        converted = format_date_series(series)
         return converted.where(converted.notna(), None)
 
     def normalize_plan(series):
         if series is None:
             return pd.Series(pd.NA, index=df.index, dtype="string")
 
-        def to_plan(value: Any) -> Any:
-            if pd.isna(value):
-                return pd.NA
-            value_str = str(value).strip()
-            if not value_str:
-                return pd.NA
-            # convert float-like strings (e.g. "12345.0") into integers
-            try:
-                numeric = float(value_str)
-                if numeric.is_integer():
-                    return f"{int(numeric)}"
-            except ValueError:
-                pass
-            return value_str
-
-        return series.apply(to_plan).astype("string")
+        return normalize_plan_series(series).astype("string")
 
     out = pd.DataFrame({
         "code": normalize_code(code),
@@ -387,42 +602,15 @@ def normalize_types(df: pd.DataFrame) -> pd.DataFrame:
     # 去掉 code/date 缺失的行
     out = out.dropna(subset=["code", "date"])
 
-    if "plan_key" not in out.columns:
-        out["plan_key"] = pd.Series(dtype="string")
-
-    if not out.empty:
-        out["plan_key"] = out["plan_key"].fillna(pd.NA)
-        mask = out["plan_key"].isna() | (out["plan_key"].str.strip() == "")
-        if mask.any():
-            out.loc[mask, "plan_key"] = (
-                LEGACY_PLAN_PREFIX + out.loc[mask, "code"].fillna("UNKNOWN")
-            )
-
+    # normalize_plan 已把空白键归为缺失，code 缺失的行也已去掉：缺失的 plan_key 一次性补成 legacy 键
+    out["plan_key"] = out["plan_key"].fillna(LEGACY_PLAN_PREFIX + out["code"])
+    # 每只股票多条记录，代码/简称/进度取值重复度很高：转 category 后去重、排序都按整数编码比较
+    for col in ("code", "name", "progress"):
+        out[col] = out[col].astype("category")
     return out
 
 
-def load_to_db(
-    latest_csv: Path = LATEST_CSV,
-    increment_csv: Path = INCREMENT_CSV,
-    db_path: Path = DB
-) -> tuple[int, int]:
-    ensure_result_dir()
-    sources = []
-    if latest_csv.exists():
-        sources.append(pd.read_csv(latest_csv))
-    elif latest_csv == LATEST_CSV and LEGACY_LATEST_CSV.exists():
-        sources.append(pd.read_csv(LEGACY_LATEST_CSV))
-    if increment_csv.exists():
-        sources.append(pd.read_csv(increment_csv))
-    elif increment_csv == INCREMENT_CSV and LEGACY_INCREMENT_CSV.exists():
-        sources.append(pd.read_csv(LEGACY_INCREMENT_CSV))
-    if not sources:
-        raise SystemExit("No CSV sources found. Expected repurchase_latest.csv and/or repurchase_increment.csv")
-
-    raw_df = pd.concat(sources, ignore_index=True)
-    df = normalize_types(raw_df)
-
-    conn = sqlite3.connect(db_path)
+def _load_in_transaction(conn: sqlite3.Connection, df: pd.DataFrame) -> int:
     ensure_buyback_table(conn)
     before_norm, after_norm = normalize_existing_buyback_codes(conn)
     if before_norm and before_norm != after_norm:
@@ -436,46 +624,67 @@ def load_to_db(
             f"[INFO] 修复历史计划匹配：更新 {updated} 条，删除 {deleted} 条冗余记录"
         )
 
+    # normalize_types 已补齐 plan_key，assign_plan_keys 只会替换成非空的计划键
     df = assign_plan_keys(df, plan_lookup)
 
-    if not df.empty:
-        df["plan_key"] = df["plan_key"].fillna(pd.NA)
-        missing = df["plan_key"].isna() | (df["plan_key"].str.strip() == "")
-        if missing.any():
-            df.loc[missing, "plan_key"] = (
-                LEGACY_PLAN_PREFIX + df.loc[missing, "code"].fillna("UNKNOWN")
-            )
-
     df = df.drop_duplicates(subset=["code", "plan_key", "date"], keep="last")
+    # 按主键顺序写入：B 树页顺序追加/更新，减少页分裂与 WAL 体积（去重后主键唯一，顺序不影响结果）
+    df = df.sort_values(["code", "plan_key", "date"], kind="mergesort")
 
     cur = conn.cursor()
 
-    rows = 0
-    for rec in df.itertuples(index=False):
-        cur.execute("""
-            INSERT INTO buyback(code,plan_key,name,date,amount,volume,avg_price,progress,start_date,end_date)
-            VALUES(?,?,?,?,?,?,?,?,?,?)
-            ON CONFLICT(code,plan_key,date) DO UPDATE SET
-                name=excluded.name,
-                amount=COALESCE(excluded.amount,buyback.amount),
-                volume=COALESCE(excluded.volume,buyback.volume),
-                avg_price=COALESCE(excluded.avg_price,buyback.avg_price),
-                progress=COALESCE(excluded.progress,buyback.progress),
-                start_date=COALESCE(excluded.start_date,buyback.start_date),
-                end_date=COALESCE(excluded.end_date,buyback.end_date)
-        """, tuple(rec))
-        rows += 1
-    cur.execute("""
-        DELETE FROM buyback
-        WHERE plan_key GLOB ?
-          AND EXISTS (
-            SELECT 1 FROM buyback AS newer
-            WHERE newer.code = buyback.code
-              AND newer.date = buyback.date
-              AND newer.plan_key <> buyback.plan_key
-        )
-    """, (f"{LEGACY_PLAN_PREFIX}*",))
-    conn.commit(); conn.close()
+    # 先整批灌入无约束的临时暂存表，再一条语句合并进 buyback
+    cur.execute("DROP TABLE IF EXISTS temp.buyback_stage")
+    cur.execute(BUYBACK_STAGE_SQL)
+    cur.executemany(BUYBACK_STAGE_INSERT_SQL, df.itertuples(index=False, name=None))
+    cur.execute(BUYBACK_MERGE_SQL)
+    cur.execute("DROP TABLE temp.buyback_stage")
+    rows = len(df)
+    cur.execute(BUYBACK_LEGACY_CLEANUP_SQL)
+    return rows
+
+
+def load_to_db(
+    latest_csv: Path = LATEST_CSV,
+    increment_csv: Path = INCREMENT_CSV,
+    db_path: Path = DB
+) -> tuple[int, int]:
+    ensure_result_dir()
+    sources = []
+    if latest_csv.exists():
+        sources.append(read_source_csv(latest_csv))
+    elif latest_csv == LATEST_CSV and LEGACY_LATEST_CSV.exists():
+        sources.append(read_source_csv(LEGACY_LATEST_CSV))
+    if increment_csv.exists():
+        sources.append(read_source_csv(increment_csv))
+    elif increment_csv == INCREMENT_CSV and LEGACY_INCREMENT_CSV.exists():
+        sources.append(read_source_csv(LEGACY_INCREMENT_CSV))
+    if not sources:
+        raise SystemExit("No CSV sources found. Expected repurchase_latest.csv and/or repurchase_increment.csv")
+
+    raw_df = pd.concat(sources, ignore_index=True)
+    df = normalize_types(raw_df)
+
+    # isolation_level=None：由下面显式的 BEGIN IMMEDIATE / COMMIT 管理事务，sqlite3 模块不再隐式开启或提交
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    # WAL + NORMAL 同步：批量写入只追加日志，不在每次提交时 fsync 主库（journal_mode 须在事务外设置）
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
+    try:
+        # 建表迁移、旧数据规范化、计划键修复与本次合并共用一个写事务：只提交一次，任一步失败整体回滚
+        conn.execute("BEGIN IMMEDIATE")
+        rows = _load_in_transaction(conn, df)
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        conn.close()
+        raise
+    # 写入后按需刷新统计信息，让查询规划器在 date/code 两个索引间选对路径
+    conn.execute("PRAGMA optimize")
+    conn.close()
     return rows, len(sources)
 
 
@@ -0,0 +1,45 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import ak_repurchase_plans as ak_plans
+
+pytest.importorskip("pyarrow.csv")
+
+
+def _write_both(df, tmp_path, monkeypatch):
+    fast, fallback = tmp_path / "fast.csv", tmp_path / "fallback.csv"
+    ak_plans.write_csv(df, fast)
+    # 屏蔽 pyarrow.csv，让 write_csv 走 DataFrame.to_csv 分支
+    monkeypatch.setitem(sys.modules, "pyarrow.csv", None)
+    ak_plans.write_csv(df, fallback)
+    return fast.read_bytes(), fallback.read_bytes()
+
+
+def test_write_csv_same_bytes_with_and_without_pyarrow(tmp_path, monkeypatch):
+    df = pd.DataFrame({
+        "code": ["000001", "600000", None, "300750"],
+        "sec_name": pd.array(["平安银行", None, "", "宁德时代"], dtype="string"),
+        "plan_key": ["0d8c07d94d663ea6", "248a05d6797f0ec7", "af6b2a817f04ad3d", "31ff991f519c9428"],
+        "version": [1.0, 2.0, 1.0, np.nan],
+        "announce_date": ["2024-01-02", "2024-02-03", None, "2024-03-04"],
+        "price_lower": [10.0, 0.1, np.nan, 1e-05],
+        "amount_upper": [2000000.0, 1e16, 123456789.125, np.nan],
+    })
+    fast, fallback = _write_both(df, tmp_path, monkeypatch)
+    assert fast == fallback
+    assert b",10.0," in fast
+
+
+def test_write_csv_values_needing_quotes_match_to_csv(tmp_path, monkeypatch):
+    df = pd.DataFrame({
+        "code": ["000001", "000002"],
+        "progress_text": ['实施中,已回购', '含"引号"'],
+        "price_lower": [10.0, np.nan],
+    })
+    fast, fallback = _write_both(df, tmp_path, monkeypatch)
+    assert fast == fallback